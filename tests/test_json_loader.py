@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+from wb_modbus_device_editor import json_loader
+from wb_modbus_device_editor.template_manager import TemplateManager
+
+# шаблоны скачиваются программой, в CI путь к ним можно указать явно
+TEMPLATES_DIR = os.environ.get("WB_TEMPLATES_DIR", TemplateManager._DEFAULT_TEMPLATES_DIR)
+
+
+def has_templates():
+    return os.path.isdir(TEMPLATES_DIR) and bool(json_loader.get_template_names(TEMPLATES_DIR))
+
+
+def test_strip_comments_keeps_strings():
+    text = """
+    {
+        // comment
+        "url": "http://example.com/*not a comment*/", /* block
+        comment */ "list": [1, 2, /* three */ 3,],
+        "escaped": "quote \\" // still a string",
+    }
+    """
+    assert json_loader.loads(text) == {
+        "url": "http://example.com/*not a comment*/",
+        "list": [1, 2, 3],
+        "escaped": 'quote " // still a string',
+    }
+
+
+def test_loads_falls_back_to_commentjson():
+    assert json_loader.loads('{"a": 1 # comment\n}') == {"a": 1}
+
+
+@pytest.mark.skipif(not has_templates(), reason=f"no templates in {TEMPLATES_DIR}")
+def test_loaders_give_same_templates():
+    comparison = json_loader.compare_loaders(TEMPLATES_DIR)
+
+    # шаблоны, которые commentjson не читает, проверены только разбором без него
+    for name in comparison.unparsed:
+        with open(os.path.join(TEMPLATES_DIR, name), encoding="utf-8") as file:
+            json_loader.loads(file.read())
+    assert comparison.mismatched == []
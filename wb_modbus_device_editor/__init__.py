@@ -0,0 +1,7 @@
+import sys
+
+# импорты замеряются с самого начала, до загрузки остальных модулей пакета
+if "--startup-report" in sys.argv[1:]:
+    from . import startup_report
+
+    startup_report.start()
@@ -0,0 +1,153 @@
+import concurrent.futures
+import re
+import time
+
+from . import modbus_planner
+from .modbus_client import get_port_key
+
+MAX_SLAVE_ID = 247
+
+
+def parse_slave_ids(text):
+    # адреса перечисляются через запятую, диапазоны через дефис: "1-10, 15"
+    slave_ids = []
+
+    for part in re.split(r"[,;\s]+", text.strip()):
+        if not part:
+            continue
+
+        first, sep, last = part.partition("-")
+        try:
+            first = int(first)
+            last = int(last) if sep else first
+        except ValueError as e:
+            raise ValueError(f"Неверный адрес устройства: {part}") from e
+
+        if not 1 <= first <= last <= MAX_SLAVE_ID:
+            raise ValueError(f"Неверный диапазон адресов: {part}")
+        slave_ids.extend(range(first, last + 1))
+
+    if not slave_ids:
+        raise ValueError("Не указаны адреса устройств")
+
+    return list(dict.fromkeys(slave_ids))
+
+
+def parse_buses(text, mb_params):
+    # для RTU перечисляются порты, для TCP — шлюзы в виде host:port;
+    # если ничего не указано, используются текущие настройки подключения
+    buses = []
+
+    for part in re.split(r"[,;\s]+", text.strip()):
+        if not part:
+            continue
+
+        if mb_params["mode"] == "RTU":
+            buses.append({**mb_params, "port": part})
+            continue
+
+        host, sep, port = part.rpartition(":")
+        if not sep:
+            host, port = part, mb_params["port"]
+        try:
+            buses.append({**mb_params, "ip": host, "port": int(port)})
+        except ValueError as e:
+            raise ValueError(f"Неверный адрес шлюза: {part}") from e
+
+    return buses or [mb_params]
+
+
+class BatchTarget:
+    def __init__(self, mb_params, slave_id):
+        self.mb_params = mb_params
+        self.slave_id = slave_id
+
+    @property
+    def bus_name(self):
+        if self.mb_params["mode"] == "RTU":
+            return self.mb_params["port"]
+        return f"{self.mb_params['ip']}:{self.mb_params['port']}"
+
+
+class BatchResult:
+    def __init__(self, target):
+        self.target = target
+        self.error = None
+        self.total = 0  # сколько параметров прочитано или записано
+        self.failed = 0
+        self.mismatched = 0  # сколько прочитанных значений отличаются от значений в редакторе
+        self.duration = 0.0
+
+
+class BatchRunner:
+    """
+    Читает или записывает параметры шаблона на множестве устройств.
+    Устройства одной шины опрашиваются друг за другом без переоткрытия порта,
+    разные шины — параллельно через общий ModbusEngine.
+    """
+
+    def __init__(self, engine, read_planner, write_planner, cancel_token=None, max_timeouts=1):
+        self.engine = engine
+        self.read_planner = read_planner
+        self.write_planner = write_planner
+        self.cancel_token = cancel_token
+        self.max_timeouts = max_timeouts
+
+    def run(self, targets, operation, params, values, model):
+        buses = {}
+        for target in targets:
+            buses.setdefault(get_port_key(target.mb_params), []).append(target)
+
+        start = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(buses)) as executor:
+            futures = [
+                executor.submit(self._run_bus, bus_targets, operation, params, values, model)
+                for bus_targets in buses.values()
+            ]
+            results = [result for future in futures for result in future.result()]
+
+        return results, time.monotonic() - start
+
+    def _run_bus(self, targets, operation, params, values, model):
+        from pymodbus.exceptions import ModbusException  # pymodbus загружается при первом обмене
+
+        results = []
+
+        for target in targets:
+            client = self.engine.client(target.mb_params)
+            result = BatchResult(target)
+            start = time.monotonic()
+            # у каждого устройства свой счётчик таймаутов, отмена — общая для всех
+            guard = modbus_planner.TransactionGuard(self.cancel_token, self.max_timeouts)
+
+            try:
+                if operation == "read":
+                    self._read_device(client, target.slave_id, params, values, model, result, guard)
+                else:
+                    self._write_device(client, target.slave_id, values, result, guard)
+            except modbus_planner.OperationCancelled:
+                result.error = "операция остановлена"
+            except (ModbusException, ConnectionError) as e:
+                result.error = str(e)
+
+            result.duration = time.monotonic() - start
+            results.append(result)
+
+        return results
+
+    def _read_device(self, client, slave_id, params, values, model, result, guard):
+        signature = (model, modbus_planner.read_firmware_version(client, slave_id, guard))
+        expected = {id: value for id, param, value in values}
+
+        for id, param, value in self.read_planner.read(client, slave_id, params, signature, guard=guard):
+            result.total += 1
+            if value is None:
+                result.failed += 1
+            elif id in expected and not modbus_planner.is_same_param_value(param, expected[id], value):
+                result.mismatched += 1
+
+    def _write_device(self, client, slave_id, values, result, guard):
+        for id, param, value in self.write_planner.write(client, slave_id, values, guard):
+            result.total += 1
+            if value is None:
+                result.failed += 1
@@ -0,0 +1,74 @@
+import collections
+import heapq
+
+
+class ConditionGraph:
+    """
+    Dependencies between widget conditions and parameters they reference.
+    After a parameter change only the widgets depending on it are re-evaluated,
+    widgets are evaluated in topological order, so each one is usually evaluated once.
+    """
+
+    max_evaluations = 10  # conditions depending on each other in a cycle may never settle
+
+    def __init__(self, conditions):
+        self.conditions = conditions  # widget id -> template_manager.Condition
+        self.dependents = {}  # parameter id -> ids of widgets which conditions reference the parameter
+        for widget_id, condition in conditions.items():
+            for name in sorted(condition.names):
+                self.dependents.setdefault(name, []).append(widget_id)
+        self.rank = self._sort()
+
+    def _sort(self):
+        # hiding a parameter removes its value, so conditions of parameters go before their dependents
+        indegree = dict.fromkeys(self.conditions, 0)
+        for name, widget_ids in self.dependents.items():
+            if name in self.conditions:
+                for widget_id in widget_ids:
+                    indegree[widget_id] += 1
+
+        ready = collections.deque(widget_id for widget_id, degree in indegree.items() if degree == 0)
+        order = []
+        while ready:
+            widget_id = ready.popleft()
+            order.append(widget_id)
+            for dependent in self.dependents.get(widget_id, ()):
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    ready.append(dependent)
+
+        # widgets of a cycle are evaluated last in the order of the template
+        sorted_ids = set(order)
+        order.extend(widget_id for widget_id in self.conditions if widget_id not in sorted_ids)
+        return {widget_id: rank for rank, widget_id in enumerate(order)}
+
+    def propagate(self, changed, update):
+        """
+        Re-evaluates widgets depending on changed parameter ids.
+        update(widget_id) applies the condition of the widget and returns True if its visibility flipped.
+        """
+        self._run({widget_id for name in changed for widget_id in self.dependents.get(name, ())}, update)
+
+    def evaluate_all(self, update):
+        self._run(set(self.conditions), update)
+
+    def _run(self, widget_ids, update):
+        queue = [(self.rank[widget_id], widget_id) for widget_id in widget_ids]
+        heapq.heapify(queue)
+        queued = set(widget_ids)
+        evaluations = collections.Counter()
+
+        while queue:
+            _, widget_id = heapq.heappop(queue)
+            queued.discard(widget_id)
+
+            evaluations[widget_id] += 1
+            if evaluations[widget_id] > self.max_evaluations:
+                continue
+
+            # the value of a shown or hidden parameter appears or disappears, its dependents are next
+            if update(widget_id):
+                for dependent in self.dependents.get(widget_id, ()):
+                    if dependent not in queued:
+                        queued.add(dependent)
+                        heapq.heappush(queue, (self.rank[dependent], dependent))
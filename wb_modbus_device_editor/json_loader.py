@@ -0,0 +1,117 @@
+import json
+import os
+import re
+import sys
+
+# a block comment can't be extended past its first */ by backtracking, unlike /\*.*?\*/
+_COMMENT = r"//[^\n]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/"
+
+# one pass over the text: strings are kept as is, comments and trailing commas are removed
+_TOKENS = re.compile(
+    rf"""
+    (?P<string>"(?:\\.|[^"\\])*")
+    | (?P<comment>{_COMMENT})
+    | (?P<comma>,(?=(?:\s|{_COMMENT})*[}}\]]))
+    """,
+    re.VERBOSE,
+)
+
+
+def _replace(match):
+    if match.lastgroup == "string":
+        return match.group()
+    if match.lastgroup == "comment":
+        return " "  # a comment may separate tokens
+    return ""
+
+
+def strip_comments(text):
+    return _TOKENS.sub(_replace, text)
+
+
+def loads(text):
+    """
+    Parses JSON with comments and trailing commas with the standard json module,
+    commentjson is used only for the files it can't handle
+    """
+    try:
+        return json.loads(strip_comments(text))
+    except ValueError:
+        import commentjson
+
+        return commentjson.loads(text)
+
+
+def load(file):
+    return loads(file.read())
+
+
+class LoadersComparison:
+    """Names of templates sorted by the result of both loaders"""
+
+    def __init__(self):
+        self.checked = []
+        self.fallback = []  # read through commentjson, so the result is the same by definition
+        self.unparsed = []  # commentjson can't read them (/* */ comments), checked only by this loader
+        self.mismatched = []
+
+
+def get_template_names(templates_dir):
+    return [
+        name
+        for name in sorted(os.listdir(templates_dir))
+        if name.endswith(".json") and os.path.isfile(os.path.join(templates_dir, name))
+    ]
+
+
+def compare_loaders(templates_dir):
+    """Parses every template of the dir with both loaders, the results must be the same"""
+    import commentjson
+
+    comparison = LoadersComparison()
+    for name in get_template_names(templates_dir):
+        with open(os.path.join(templates_dir, name), encoding="utf-8") as file:
+            text = file.read()
+        comparison.checked.append(name)
+        try:
+            result = json.loads(strip_comments(text))
+        except ValueError:
+            comparison.fallback.append(name)
+            continue
+        try:
+            expected = commentjson.loads(text)
+        except ValueError:
+            comparison.unparsed.append(name)
+            continue
+        if result != expected:
+            comparison.mismatched.append(name)
+
+    return comparison
+
+
+def main(argv):
+    # проверка совместимости: оба загрузчика должны давать одинаковый результат для всех шаблонов,
+    # то же самое проверяет tests/test_json_loader.py
+    if len(argv) > 1:
+        templates_dir = argv[1]
+    else:
+        from .template_manager import TemplateManager
+
+        templates_dir = TemplateManager._DEFAULT_TEMPLATES_DIR
+
+    comparison = compare_loaders(templates_dir)
+    for name in comparison.fallback:
+        print(f"Читается через commentjson: {name}")
+    for name in comparison.unparsed:
+        print(f"Не читается через commentjson, проверен только разбор без него: {name}")
+    for name in comparison.mismatched:
+        print(f"Результат отличается: {name}")
+    print(
+        f"Проверено шаблонов: {len(comparison.checked)}, через commentjson: {len(comparison.fallback)}, "
+        f"не читается commentjson: {len(comparison.unparsed)}, отличается: {len(comparison.mismatched)}"
+    )
+    return 1 if comparison.mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
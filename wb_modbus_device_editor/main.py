@@ -1,37 +1,115 @@
-import queue
+import collections
+import os
 import sys
 import threading
+import time
 import tkinter
 import traceback
 
-import pymodbus
-
-from . import modbus_client, template_manager, tk_threading, ui_manager
+from . import (
+    batch_runner,
+    condition_graph,
+    modbus_client,
+    modbus_metrics,
+    modbus_planner,
+    startup_report,
+    template_manager,
+    tk_threading,
+    ui_manager,
+)
 
 
 class App:
     max_col = 2  # количество колонок с виджетами +1
+    read_max_gap = 0  # сколько неиспользуемых регистров можно прочитать, чтобы объединить соседние блоки
+    session_idle_timeout = 60  # через сколько секунд простоя закрывается соединение с устройством
+    max_timeouts = 1  # после скольких таймаутов подряд операция прерывается (например, неверный адрес)
+    virtual_tab_size = 100  # вкладки с большим числом параметров показываются списком только видимых строк
 
-    def __init__(self):
+    def __init__(self, report=None):
         # создаём объекты для работы
         self.ui = ui_manager.UiManager()
+        if report is not None:
+            report.watch(self.ui.win)
         self.ui.btn_open_template.bind("<ButtonPress-1>", self.btn_open_template_click)
         self.ui.btn_read_params.bind("<ButtonPress-1>", self.btn_read_params_click)
         self.ui.btn_write_params.bind("<ButtonPress-1>", self.btn_write_params_click)
+        self.ui.btn_batch.bind("<ButtonPress-1>", self.btn_batch_click)
+        self.ui.btn_stop.bind("<ButtonPress-1>", self.btn_stop_click)
+        self.ui.btn_stats.bind("<ButtonPress-1>", self.btn_stats_click)
+        self.ui.notebook.bind("<<NotebookTabChanged>>", self.tab_changed)
+        self.ui.chk_table_view.configure(command=self.table_view_changed)
 
         self.template_manager = template_manager.TemplateManager()
         self._template = None
+        self.condition_graph = None  # зависимости условий видимости от параметров открытого шаблона
+        self.pending_groups = {}  # вкладка -> ещё не созданные группы (None — параметры без групп)
+        self.build_job = None  # фоновое создание виджетов остальных вкладок
+        self.table_view = False  # параметры групп показываются таблицами, а не отдельными виджетами
+        self.templates_catalog = []  # (строка поиска, строка таблицы) шаблонов для окна выбора
         self.io_running = False
         self.io_lock = threading.Lock()
 
         self.client = None
-
-        if self.template_manager.update_needed:
-            self.ui.win.after(100, self.btn_update_template_click)
-        else:
+        self.metrics = modbus_metrics.MetricsRegistry()  # статистика обмена по каждой шине и устройству
+        self.sessions = modbus_client.ModbusSessionManager(
+            idle_timeout=self.session_idle_timeout, metrics=self.metrics
+        )
+        self.read_planner = modbus_planner.ReadPlanner(max_gap=self.read_max_gap)
+        self.write_planner = modbus_planner.WritePlanner()
+        self.engine = None  # для пакетного режима, создаётся при первом использовании
+
+        # последние известные значения регистров устройства, чтобы записывать только изменённые параметры
+        self.device_values = {}
+        self.device_values_key = None  # (шина, адрес) устройства, к которому относятся значения
+        self.io_device = None
+        self.io_task = None  # текущая операция чтения/записи, её можно остановить (TaskInThread.cancel)
+        self.read_started = None
+
+        # наличие обновлений проверяется в фоне, пока можно работать со скачанными ранее шаблонами
+        if self.template_manager.templates_available:
             self.ui.write_log("Настройте параметры подключения и откройте шаблон.")
+        self.ui.win.after(100, self.check_templates_update)
 
         self.ui.win.mainloop()
+        # операция ввода/вывода останавливается после текущего запроса, ещё не начатые задачи отменяются
+        if self.io_task is not None:
+            self.io_task.cancel()
+        tk_threading.shutdown()
+        self.sessions.close_all()
+        if self.engine is not None:
+            self.engine.stop()
+
+    def check_templates_update(self):
+        tk_threading.TaskInThread(
+            self.ui.win,
+            self.template_manager.check_update,
+            callback=self.check_templates_update_callback,
+            errback=self.check_templates_update_errback,
+        )
+
+    def check_templates_update_callback(self, update_needed):
+        if not update_needed:
+            return
+
+        with self.io_lock:
+            running = self.io_running
+        if running:
+            # обновление начнётся, когда закончится текущая операция чтения/записи
+            self.ui.win.after(1000, self.check_templates_update_callback, update_needed)
+            return
+
+        self.btn_update_template_click()
+
+    def check_templates_update_errback(self, error):
+        if self.template_manager.templates_available:
+            self.ui.write_log(
+                f"Не удалось проверить обновления шаблонов, используются скачанные ранее: {error}"
+            )
+        else:
+            self.ui.write_log(
+                f"Не удалось скачать шаблоны: {error}. Проверьте подключение к интернету и перезапустите программу."
+            )
 
     def btn_update_template_click(self):
 
@@ -41,14 +119,13 @@ class App:
                 return
 
         self.ui.write_log("Обновление шаблонов, пожалуйста подождите. Это может занять около минуты.")
+        self.io_task = None
 
-        # проверяем поток с обновлением шаблонов пореже - раз в 10 секунд чтобы не висел UI
         tk_threading.TaskInThread(
             self.ui.win,
             self.template_manager.update_templates,
             callback=self.btn_update_templates_callback,
             errback=self.btn_update_templates_errback,
-            polling=10000,
         )
 
         with self.io_lock:
@@ -72,15 +149,84 @@ class App:
                 self.ui.write_log("Выполняется операция ввода/вывода, дождитесь завершения")
                 return
 
+        window = self.ui.get_widget("nodel_templates_window")
+        if window is not None:
+            window.lift()
+            return
+
+        # каталог читается из файла, заново разбираются только новые и изменённые шаблоны
+        tk_threading.TaskInThread(
+            self.ui.win,
+            self.template_manager.get_catalog,
+            kwargs={},
+            callback=self.show_templates_window,
+            errback=self.catalog_errback,
+        )
+
+    def catalog_errback(self, error):
+        self.ui.write_log(f"Не удалось прочитать список шаблонов: {error}")
+        self.browse_template()
+
+    def show_templates_window(self, catalog):
+        # строка поиска по каждому шаблону готовится один раз, фильтрация — простой поиск подстрок
+        self.templates_catalog = []
+        for file_name, entry in sorted(catalog.items()):
+            if entry["deprecated"]:
+                continue
+            title = entry["titles"].get("ru") or entry["title"] or file_name
+            device_type = entry["device_type"] or ""
+            names = [file_name, device_type, entry["group"] or "", entry["title"] or ""]
+            search_text = " ".join([*names, *entry["titles"].values()])
+            self.templates_catalog.append((search_text.casefold(), (file_name, title, device_type)))
+
+        if self.ui.get_widget("nodel_templates_window") is None:
+            self.ui.create_templates_window()
+            self.ui.get_widget("nodel_templates_filter").bind("<KeyRelease>", self.filter_templates)
+            self.ui.btn_templates_open.bind("<ButtonPress-1>", self.btn_templates_open_click)
+            self.ui.btn_templates_browse.bind("<ButtonPress-1>", self.btn_templates_browse_click)
+            self.ui.get_widget("nodel_templates_table").bind("<Double-1>", self.btn_templates_open_click)
+            self.ui.get_widget("nodel_templates_filter").bind("<Return>", self.btn_templates_open_click)
+        self.filter_templates()
+
+    def filter_templates(self, event=None):
+        words = self.ui.get_value("nodel_templates_filter").casefold().split()
+        rows = [
+            row for search_text, row in self.templates_catalog if all(word in search_text for word in words)
+        ]
+        self.ui.show_templates(rows)
+
+    def btn_templates_open_click(self, event):
+        file_name = self.ui.get_selected_template()
+        if file_name is None:
+            return
+
+        self.ui.close_templates_window()
+        self.open_template_file(os.path.join(self.template_manager.templates_dir, file_name))
+
+    def btn_templates_browse_click(self, event):
+        self.ui.close_templates_window()
+        self.browse_template()
+
+    def browse_template(self):
         templates_dir = self.template_manager.templates_dir
         file_path = self.ui.open_file(templates_dir)
         if not file_path:
             return
+        self.open_template_file(file_path)
+
+    def open_template_file(self, file_path):
+        with self.io_lock:
+            if self.io_running:
+                self.ui.write_log("Выполняется операция ввода/вывода, дождитесь завершения")
+                return
 
         # удаляем виджеты от предыдущего шаблона
+        self.cancel_build()
         self.ui.delete_widgets()
+        self.condition_graph = None
 
         self.ui.write_log("Чтение файла {}".format(file_path))
+        self.io_task = None
         tk_threading.TaskInThread(
             self.ui.win,
             self.load_template,
@@ -102,6 +248,8 @@ class App:
 
     def open_template_callback(self, result):
         self._template = result
+        self.device_values = {}
+        self.device_values_key = None
 
         self.ui.write_log(f"Чтение шаблона завершено.")
 
@@ -111,111 +259,281 @@ class App:
             self.io_running = False
 
     def create_interface(self):
+        # виджеты создаются только для открытой вкладки, остальные вкладки строятся в фоне
+        # или при переходе на них; значения и видимость всех параметров сразу хранятся в модели,
+        # поэтому чтение, запись и условия работают и для ещё не созданных виджетов
+        self.pending_groups = {}
+
         # если у нас есть параметры без групп, например, режимы — создаём для них отдельную вкладку
         parameters = self._template.get_parameters_by_group_id(None)
 
         if len(parameters) > 0:
-            parent = self.ui.create_tab("mode_params_group", "Режим")
-            curr_frame = parent.curr_frame
-
-            # перебираем безгрупные параметры и создаём для них виджеты
-            for id, parameter in parameters.items():
-                self.create_widget(id, parent, parameter)
+            self.create_tab("mode_params_group", "Режим", len(parameters))
+            self.pending_groups["mode_params_group"] = collections.deque([None])  # параметры без групп
 
         try:
             # создаём вкладки из групп без поля group
             self.create_pages()
-            # создаём группы внутри вкладок
-            self.create_groups()
+            # значения параметров попадают в модель до создания виджетов
+            self.declare_params()
+            self.create_condition_graph()
             self.widgets_hide_by_condition()
-        except AttributeError as e:
+            self.create_tab_groups(self.ui.get_current_tab_id())
+        except template_manager.TemplateException as e:
+            self.cancel_build()
             self.ui.delete_widgets()
             self.ui.write_log("К сожалению, в настоящее время использование этого шаблона не поддерживается.")
+            self.ui.write_log(str(e))
         except Exception as e:
             self.ui.write_log("Ошибка:")
             self.ui.write_log(traceback.format_exc())
 
+        self.schedule_build()
+
     # создание страниц
     def create_pages(self):
 
         groups = self._template.properties["device"]["groups"]
-        if groups is not None:
-
-            for id, group in groups.items():
-                # если у группы нет родителя, то создаём вкладку
-                if not group.get("group"):
-                    title = self._template.translate(group["title"])
-                    group_widget = self.ui.create_tab(id, title)
-                    group_widget.condition = group.get("condition")
-
-    # создание групп
-    def create_groups(self):
-
-        groups = self._template.properties["device"]["groups"]
+        if groups is None:
+            raise template_manager.TemplateException("В шаблоне нет групп")
 
+        # группы распределяются по вкладкам в порядке шаблона; вкладки попадают в очередь создания только
+        # после этого: при добавлении первой вкладки Tk сразу выбирает её и вызывает tab_changed
+        tab_ids = self._template.get_child_group_ids(None)
+        tab_group_ids = {id: collections.deque() for id in tab_ids}
         for id, group in groups.items():
-            title = self._template.translate(group["title"])
             parent_id = group.get("group")
-            parent = self.ui.get_widget(parent_id)
-
-            # а тут магия распределения групп по вкладкам
-            if parent != None:  # если у группы нет родителя, то есть это у нас вкладка, то
-                # проверяем, не вышли ли за пределы максимального числа колонок
-                if parent.curr_col < self.max_col:
-                    # если не вышли, то получаем текущий фрейм (строку) и потом увеличиваем счётчик колонок
-                    curr_frame = self.get_current_frame(parent)
-                    parent.curr_col += 1
-                else:
-                    # если счётчик колонок равен максимальном числу колонок на вкладке, то
-                    # создаём новую строку, обнуляем счётчик колонок и увеличиваем счётчик строк
-                    curr_frame = self.ui.create_row(parent, parent_id + "_row")
-                    parent.curr_frame = curr_frame
-                    parent.curr_col = 0
-                    parent.curr_row += 1
-
-                # создаём новую группу с учётом магии выше
-                group_widget = self.ui.create_group(
-                    curr_frame, id, title, side=tkinter.LEFT, anchor=tkinter.NW
+            if parent_id in groups and parent_id not in tab_group_ids:
+                raise template_manager.TemplateException(
+                    f"Группа {id} вложена в группу {parent_id}, а не во вкладку"
                 )
-                # добавляем поле condition — это для того, чтобы понимать, надо ли показывать
-                # эту группу при выбранных параметрах
-                group_widget.condition = group.get("condition")
-            else:
-                # а если родитель у группы есть, то получаем текущий виджет с нужным id
-                group_widget = self.ui.get_widget(id)
 
-            # если виджет группы существует — создаём параметры в ней
-            if group_widget is not None:
-                self.create_params(id, group_widget)
+            group_ids = tab_group_ids.get(self._template.get_root_group_id(id))
+            if group_ids is not None:
+                group_ids.append(id)
             else:
                 print("Виджет для группы {} не существует".format(id))
 
+        # группы без родителя — это вкладки
+        for id in tab_ids:
+            group = groups[id]
+            title = self._template.translate(group["title"])
+            size = sum(
+                len(self._template.get_parameters_by_group_id(group_id)) for group_id in tab_group_ids[id]
+            )
+            group_widget = self.create_tab(id, title, size)
+            group_widget.condition = group.get("condition")
+        self.pending_groups.update(tab_group_ids)
+
+    def create_tab(self, id, title, size):
+        # в табличном режиме у группы один виджет, список для больших вкладок не нужен
+        if size > self.virtual_tab_size and not self.table_view:
+            return self.ui.create_virtual_tab(id, title, selected_func=self.combobox_selected)
+        return self.ui.create_tab(id, title)
+
+    def declare_params(self):
+        # параметры групп, для которых не будет виджетов, не попадают в модель и не записываются
+        tab_group_ids = {group_id for group_ids in self.pending_groups.values() for group_id in group_ids}
+
+        for id, param in (self._template.properties["device"]["parameters"] or {}).items():
+            if param.get("group") not in tab_group_ids:
+                continue
+
+            enum = None
+            if self._template.get_value_type(id) == "enum":
+                enum = self._template.get_parameter_enum(id)
+            self.ui.declare_param(id, enum, param.get("default"))
+
+    def table_view_changed(self):
+        with self.io_lock:
+            if self.io_running:
+                self.ui.write_log("Выполняется операция ввода/вывода, дождитесь завершения")
+                self.ui.table_view.set(self.table_view)
+                return
+
+        self.table_view = self.ui.table_view.get()
+        if self._template is None:
+            return
+
+        # интерфейс перестраивается, значения и состояние параметров сохраняются
+        values = dict(self.ui.model.values)
+        disabled = set(self.ui.model.disabled)
+        self.cancel_build()
+        self.ui.delete_widgets()
+        self.condition_graph = None
+
+        self.create_interface()
+        for id, value in values.items():
+            self.ui.set_value(id, value)
+        for id in disabled:
+            self.ui.widget_disable(id)
+        self.widgets_hide_by_condition()
+
+    def tab_changed(self, event):
+        # открытая вкладка нужна сразу, не дожидаясь фонового создания
+        self.create_tab_groups(self.ui.get_current_tab_id())
+
+    def schedule_build(self):
+        if self.build_job is None and self.pending_groups:
+            self.build_job = self.ui.win.after_idle(self.build_next_group)
+
+    def cancel_build(self):
+        if self.build_job is not None:
+            self.ui.win.after_cancel(self.build_job)
+            self.build_job = None
+        self.pending_groups = {}
+
+    def build_next_group(self):
+        # в фоне за один раз создаётся одна группа, между ними окно успевает обработать действия пользователя
+        self.build_job = None
+        tab_id = next(iter(self.pending_groups), None)
+        if tab_id is not None:
+            self.create_tab_groups(tab_id, count=1)
+        self.schedule_build()
+
+    def create_tab_groups(self, tab_id, count=None):
+        group_ids = self.pending_groups.get(tab_id)
+        if group_ids is None:
+            return
+
+        try:
+            while group_ids and count != 0:
+                self.create_group_widgets(group_ids.popleft())
+                if count is not None:
+                    count -= 1
+        except Exception as e:
+            self.cancel_build()
+            self.ui.write_log("Ошибка:")
+            self.ui.write_log(traceback.format_exc())
+            return
+
+        if not group_ids:
+            del self.pending_groups[tab_id]
+
+    # создание групп
+    def create_group_widgets(self, id):
+        if id is None:
+            # параметры без групп находятся на отдельной вкладке режимов
+            parent = self.ui.get_widget("mode_params_group")
+            parameters = self._template.get_parameters_by_group_id(None)
+            if self.table_view:
+                self.create_params_table("mode_params_group", parent, parameters)
+                return
+            for param_id, parameter in parameters.items():
+                self.create_widget(param_id, parent, parameter)
+            return
+
+        group = self._template.properties["device"]["groups"][id]
+        title = self._template.translate(group["title"])
+        parent_id = group.get("group")
+        parent = self.ui.get_widget(parent_id)
+
+        if parent != None and parent.type == "virtual_tab":
+            # во вкладке-списке группа — это строка с заголовком, за которой идут строки её параметров
+            self.ui.add_virtual_group(parent, id, title)
+            self.create_params(id, parent)
+            return
+
+        max_col = self.max_col
+        group_opts = {"side": tkinter.LEFT, "anchor": tkinter.NW}
+        if self.table_view:
+            # таблицы групп по одной в строке на всю ширину вкладки
+            max_col = 0
+            group_opts = {"side": tkinter.LEFT, "anchor": tkinter.NW, "fill": tkinter.X, "expand": True}
+
+        # а тут магия распределения групп по вкладкам
+        if parent != None:  # если у группы нет родителя, то есть это у нас вкладка, то
+            # проверяем, не вышли ли за пределы максимального числа колонок
+            if parent.curr_col < max_col:
+                # если не вышли, то получаем текущий фрейм (строку) и потом увеличиваем счётчик колонок
+                curr_frame = self.get_current_frame(parent)
+                parent.curr_col += 1
+            else:
+                # если счётчик колонок равен максимальном числу колонок на вкладке, то
+                # создаём новую строку, обнуляем счётчик колонок и увеличиваем счётчик строк
+                curr_frame = self.ui.create_row(parent, parent_id + "_row")
+                parent.curr_frame = curr_frame
+                parent.curr_col = 0
+                parent.curr_row += 1
+
+            # создаём новую группу с учётом магии выше
+            group_widget = self.ui.create_group(curr_frame, id, title, **group_opts)
+            # группа могла быть скрыта по условию ещё до создания виджета
+            self.ui.restore_widget(id)
+        else:
+            # а если родитель у группы есть, то получаем текущий виджет с нужным id
+            group_widget = self.ui.get_widget(id)
+
+        self.create_params(id, group_widget)
+
     def create_params(self, group_id, group_widget):
         parameters = self._template.get_parameters_by_group_id(group_id)
         parent = self.get_current_frame(group_widget)
 
-        for id, parameter in parameters.items():
-            widget = self.create_widget(id, parent, parameter)
-            widget.condition = parameter.get("condition")
-            parent.condition = parameter.get("condition")
+        if self.table_view:
+            self.create_params_table(group_id, parent, parameters)
+            return
 
-    def get_value_type_type(self, param):
-        if "enum" in param:
-            return "enum"
+        for id, parameter in parameters.items():
+            self.create_widget(id, parent, parameter)
 
-        if "scale" in param:
-            return "double"
+    def create_params_table(self, group_id, parent, parameters):
+        # в табличном режиме параметры группы — строки одной таблицы, значение редактируется поверх ячейки
+        if not parameters:
+            return
 
-        return "int"
+        table = self.ui.create_params_table(
+            parent,
+            group_id + "_table",
+            selected_func=self.combobox_selected,
+            side=tkinter.TOP,
+            fill=tkinter.X,
+            expand=True,
+        )
+        for id, param in parameters.items():
+            address = param.get("address")
+            reg_type = modbus_planner.get_param_reg_type(param)
+            if address is None:
+                address = ""
+            elif reg_type != "holding":
+                address = f"{address} ({reg_type})"
+
+            self.ui.add_table_param(
+                table,
+                id,
+                title=self._template.translate(param.get("title")),
+                address=address,
+                units=param.get("units", ""),
+                min_=param.get("min"),
+                max_=param.get("max"),
+                value_type=self._template.get_value_type(id),
+            )
 
     def create_widget(self, id, parent, param):
-        value_type = self.get_value_type_type(
-            param
-        )  # от типа значения зависит тип и настройки создаваемого виджета
+        value_type = self._template.get_value_type(id)  # от типа значения зависит тип и настройки виджета
+        value = self.ui.model.values.get(id)  # значение могло быть прочитано до создания виджета
 
         title = self._template.translate(param.get("title"))
         default = param.get("default")
 
+        # во вкладке-списке виджет строки создаётся при прокрутке к ней, значение и состояние берутся из модели
+        if parent.type == "virtual_tab":
+            if value_type == "enum":
+                self.ui.add_virtual_combobox(parent, id, title, group_id=param.get("group"))
+            else:
+                self.ui.add_virtual_spinbox(
+                    parent,
+                    id,
+                    title,
+                    min_=param.get("min"),
+                    max_=param.get("max"),
+                    value_type=value_type,
+                    default=default,
+                    description=param.get("description"),
+                    group_id=param.get("group"),
+                )
+            return None
+
         # есть перечисление — создаём combobox
         if value_type == "enum":
             enum = self._template.get_parameter_enum(id)
@@ -249,6 +567,7 @@ class App:
                 anchor=tkinter.NW,
             )
 
+        self.ui.restore_widget(id, value)
         return widget
 
     # получаем текущий фрейм
@@ -260,33 +579,67 @@ class App:
         return curr_frame
 
     def combobox_selected(self, event):
-        self.widgets_hide_by_condition()
+        self.widgets_hide_by_condition(changed=[event.widget.id])
+
+    def create_condition_graph(self):
+        # условия берутся из шаблона: виджеты вкладок, которые ещё не открывали, не созданы
+        groups = self._template.properties["device"]["groups"] or {}
+        parameters = self._template.properties["device"]["parameters"] or {}
+
+        conditions = {}
+        for group_ids in self.pending_groups.values():
+            for id in group_ids:
+                # у вкладок условия не проверяются
+                if (
+                    id is not None
+                    and id not in self.pending_groups
+                    and groups[id].get("condition") is not None
+                ):
+                    conditions[id] = self._template.get_condition(groups[id]["condition"])
+        for id in self.ui.template_params:
+            if parameters[id].get("condition") is not None:
+                conditions[id] = self._template.get_condition(parameters[id]["condition"])
+        self.condition_graph = condition_graph.ConditionGraph(conditions)
+
+    def widgets_hide_by_condition(self, changed=None):
+        # пересчитываются только условия, зависящие от изменённых параметров (changed=None — все условия)
+        if self.condition_graph is None:
+            return
 
-    def widgets_hide_by_condition(self):
+        # скрытые параметры пропадают из значений сразу в widget_hide, их зависимые виджеты пересчитываются следом
         values = self.ui.get_values()
-        old_values = {}
-        iterations = 0
-        widgets = self.ui.get_widgets()
-
-        while old_values != values and iterations < 10:
-            for key, item in widgets.items():
-
-                if item.type in ["group", "spinbox", "combobox"]:
-
-                    if hasattr(item, "condition"):
-                        condition = item.condition
-                        if condition != None:
-                            visible = self._template.calc_parameter_condition(condition, values)
-                        else:
-                            visible = True
-
-                        if visible:
-                            self.ui.widget_show(key)
-                        else:
-                            self.ui.widget_hide(key)
-            old_values = values.copy()
-            values = self.ui.get_values()
-            iterations += 1
+
+        def update(key):
+            condition = self.condition_graph.conditions[key].source
+            visible = bool(self._template.calc_parameter_condition(condition, values))
+            if visible == (key not in self.ui.model.hidden):
+                return False
+
+            if visible:
+                self.ui.widget_show(key)
+            else:
+                self.ui.widget_hide(key)
+            return True
+
+        if changed is None:
+            self.condition_graph.evaluate_all(update)
+        else:
+            self.condition_graph.propagate(changed, update)
+
+    def connect_device(self, mb_params):
+        if mb_params is None or mb_params["mode"] not in ["RTU", "TCP", "RTU over TCP"]:
+            self.ui.write_log("Выбран неизвестный режим подключения!")
+            return None
+
+        # соединение переиспользуется между операциями, порт открывается только при первом обращении
+        client = self.sessions.acquire(mb_params)
+        if client is None:
+            if mb_params["mode"] == "RTU":
+                msg = f"Невозможно открыть порт {mb_params['port']}"
+            else:
+                msg = f"Невозможно открыть порт {mb_params['ip']}:{mb_params['port']}"
+            self.ui.write_log(msg)
+        return client
 
     def btn_read_params_click(self, event):
 
@@ -305,57 +658,97 @@ class App:
             return
 
         mb_params = self.ui.get_modbus_params()
-        if mb_params["mode"] == "RTU":
-            self.client = modbus_client.ModbusRTUClient(mb_params)
-        elif mb_params["mode"] == "TCP":
-            self.client = modbus_client.ModbusTCPClient(mb_params)
-        elif mb_params["mode"] == "RTU over TCP":
-            self.client = modbus_client.ModbusRTUoverTCPClient(mb_params)
-        else:
-            self.ui.write_log("Выбран неизвестный режим подключения!")
+        self.client = self.connect_device(mb_params)
+        if self.client is None:
             return
 
-        if not self.client.connect():
-            if mb_params["mode"] == "RTU":
-                msg = f"Невозможно открыть порт {mb_params['port']}"
-            elif mb_params["mode"] in ["TCP", "RTU over TCP"]:
-                msg = f"Невозможно открыть порт {mb_params['ip']}:{mb_params['port']}"
-            self.ui.write_log(msg)
-            return
+        self.io_device = (self.client.bus_key, int(mb_params["slave_id"]))
+        self.bind_device_values(self.io_device)
 
+        # значения показываются по мере чтения, начиная с параметров открытой вкладки
+        self.read_started = time.monotonic()
+        self.ui.set_progress(0, 1, "Чтение...")
+
+        cancel_token = modbus_planner.CancelToken()
         self.ui.write_log(f"Выполняется чтение параметров устройства")
-        tk_threading.TaskInThread(
+        self.io_task = tk_threading.TaskInThread(
             self.ui.win,
             self.read_params_from_modbus,
-            kwargs={"client": self.client, "slave_id": int(mb_params["slave_id"]), "params": parameters},
+            kwargs={
+                "client": self.client,
+                "slave_id": int(mb_params["slave_id"]),
+                "params": parameters,
+                "priority": self.get_tab_parameter_ids(self.ui.get_current_tab_id()),
+                "guard": modbus_planner.TransactionGuard(cancel_token, self.max_timeouts),
+            },
             callback=self.read_params_from_modbus_callback,
             errback=self.read_params_from_modbus_errback,
+            progress=self.apply_read_block,
+            cancel_token=cancel_token,
         )
 
         with self.io_lock:
             self.io_running = True
 
+    def get_tab_parameter_ids(self, tab_id):
+        ids = set()
+        if tab_id is None:
+            return ids
+
+        # параметры без групп находятся на отдельной вкладке режимов
+        if tab_id == "mode_params_group":
+            return set(self._template.get_parameters_by_group_id(None))
+
+        for group_id in self._template.properties["device"]["groups"] or {}:
+            if self._template.get_root_group_id(group_id) == tab_id:
+                ids.update(self._template.get_parameters_by_group_id(group_id))
+        return ids
+
+    def apply_read_block(self, result, done, total):
+        self.apply_read_values(result)
+
+        # оставшееся время оценивается по среднему времени чтения одного блока
+        text = f"{done}/{total}"
+        if done:
+            eta = (time.monotonic() - self.read_started) / done * (total - done)
+            text += f", осталось ~{eta:.0f} с"
+        self.ui.set_progress(done, total, text)
+
+    def apply_read_values(self, result):
+        for id, param, value in result:
+            if value is None:
+                self.device_values.pop(id, None)
+                self.ui.write_log(
+                    f"Не удалось прочитать параметр {self._template.translate(param['title'])} {param['address']}"
+                )
+                self.ui.widget_disable(id)
+                continue
+
+            self.device_values[id] = value
+            try:
+                self.ui.set_value(id, value, scale=param.get("scale"))
+                self.ui.widget_enable(id)
+            except ValueError:
+                self.ui.widget_disable(id)
+                self.ui.write_log(
+                    f"Не удалось обработать прочитанное значение {value} параметра \"{self._template.translate(param['title'])}\" регистр {param['address']}. Параметр скрыт."
+                )
+
+    def finish_read_results(self):
+        # прочитанные блоки доставляются раньше результата, так что все значения уже показаны
+        self.ui.set_progress(0, 1)
+
+    def bind_device_values(self, device):
+        # при смене устройства сохранённые значения больше не актуальны
+        if self.device_values_key != device:
+            self.device_values = {}
+            self.device_values_key = device
+
     def read_params_from_modbus_callback(self, result):
         try:
-            failed = False
-            for id, param, value in result:
-                if value is None:
-                    self.ui.write_log(
-                        f"Не удалось прочитать параметр {self._template.translate(param['title'])} {param['address']}"
-                    )
-                    self.ui.widget_disable(id)
-                    failed = True
-                    continue
-
-                try:
-                    self.ui.set_value(id, value, scale=param.get("scale"))
-                    self.ui.widget_enable(id)
-                except ValueError:
-                    self.ui.widget_disable(id)
-                    self.ui.write_log(
-                        f"Не удалось обработать прочитанное значение {value} параметра \"{self._template.translate(param['title'])}\" регистр {param['address']}. Параметр скрыт."
-                    )
+            self.finish_read_results()
 
+            failed = any(value is None for id, param, value in result)
             if failed:
                 self.ui.write_log(
                     "Не удалось прочитать некоторые параметры. Возможно их нет в этой версии прошивки устройства. Такие параметры будут недоступны для редактирования."
@@ -364,44 +757,46 @@ class App:
                 self.widgets_hide_by_condition()
                 self.ui.write_log("Чтение параметров завершено")
         finally:
-            self.client.disconnect()
+            self.sessions.release(self.client)
 
             with self.io_lock:
                 self.io_running = False
 
     def read_params_from_modbus_errback(self, error: Exception):
-        self.ui.write_log(f"Ошибка во время чтения параметов: {error}")
-        self.client.disconnect()
+        self.finish_read_results()
+        if isinstance(error, (modbus_planner.OperationCancelled, tk_threading.CancelledError)):
+            self.ui.write_log("Чтение параметров остановлено")
+            self.sessions.release(self.client)
+        else:
+            self.ui.write_log(f"Ошибка во время чтения параметов: {error}")
+            self.sessions.invalidate(self.client)
 
         with self.io_lock:
             self.io_running = False
 
-    def read_params_from_modbus(self, client, slave_id, params):
-        result = []
-
-        for id, param in params.items():
-
-            # если у параметра нет адреса, то его значение можно задать только извне и нельзя прочитать
-            address = param.get("address")
-            if address is None:
-                continue
-
-            # адреса пишут то в HEX то в DEC, надо определять и преобразовывать в DEC
-            address = int(address, 0) if isinstance(address, str) else int(address)
-
-            # бывает, что тип регистра не пишет, надо присвоить значение по умолчанию
-            reg_type = "holding" if param.get("reg_type") is None else param.get("reg_type")
+    def read_params_from_modbus(self, client, slave_id, params, priority, guard, progress):
+        from pymodbus.exceptions import ModbusIOException  # pymodbus загружается при первом обмене
 
-            if reg_type == "holding":
-                try:
-                    value = client.read_holding(slave_id=slave_id, reg_address=address)
-                    result.append((id, param, value))
-                except pymodbus.exceptions.ModbusIOException as e:
-                    raise RuntimeError(
-                        "Нет связи с устройством. Проверьте, что указаны верные параметры подключения, адрес устройства и выбран верный шаблон"
-                    ) from e
-
-        return result
+        # параметры читаются блоками соседних регистров, а не по одному;
+        # регистры, которых нет в прошивке, запоминаются для модели и версии прошивки устройства
+        try:
+            signature = (
+                self._template.properties["device"]["name"],
+                modbus_planner.read_firmware_version(client, slave_id, guard),
+            )
+            return self.read_planner.read(
+                client,
+                slave_id,
+                params,
+                signature,
+                priority=priority,
+                on_block=progress,
+                guard=guard,
+            )
+        except ModbusIOException as e:
+            raise RuntimeError(
+                "Нет связи с устройством. Проверьте, что указаны верные параметры подключения, адрес устройства и выбран верный шаблон"
+            ) from e
 
     def btn_write_params_click(self, event):
         with self.io_lock:
@@ -419,72 +814,101 @@ class App:
             return
 
         mb_params = self.ui.get_modbus_params()
-        if mb_params["mode"] == "RTU":
-            self.client = modbus_client.ModbusRTUClient(mb_params)
-        elif mb_params["mode"] == "TCP":
-            self.client = modbus_client.ModbusTCPClient(mb_params)
-        elif mb_params["mode"] == "RTU over TCP":
-            self.client = modbus_client.ModbusRTUoverTCPClient(mb_params)
-        else:
-            self.ui.write_log("Выбран неизвестный режим подключения!")
-            return
-
-        if not self.client.connect():
-            self.ui.write_log(f"Невозможно открыть порт {mb_params['port']}")
+        self.client = self.connect_device(mb_params)
+        if self.client is None:
             return
 
+        self.io_device = (self.client.bus_key, int(mb_params["slave_id"]))
+        cancel_token = modbus_planner.CancelToken()
         self.ui.write_log(f"Выполняется запись параметров")
-        tk_threading.TaskInThread(
+        self.io_task = tk_threading.TaskInThread(
             self.ui.win,
             self.write_params_to_modbus,
-            kwargs={"client": self.client, "slave_id": int(mb_params["slave_id"]), "params": parameters},
+            kwargs={
+                "client": self.client,
+                "slave_id": int(mb_params["slave_id"]),
+                "values": self.get_write_values(parameters),
+                "guard": modbus_planner.TransactionGuard(cancel_token, self.max_timeouts),
+            },
             callback=self.write_params_from_modbus_callback,
             errback=self.write_params_from_modbus_errback,
+            cancel_token=cancel_token,
         )
 
         with self.io_lock:
             self.io_running = True
 
-    def write_params_to_modbus(self, client, slave_id, params):
-        result = []
+    def get_write_values(self, params):
+        # значения виджетов переводятся в значения регистров, это делается в потоке UI
+        values = []
 
         for id, param in params.items():
-            reg_type = "holding" if param.get("reg_type") is None else param.get("reg_type")
-
             # если у параметра нет адреса, то его значение можно задать только извне и нельзя прочитать
-            address = param.get("address")
-            if address is None:
+            if param.get("address") is None:
                 continue
 
-            address = int(address, 0) if isinstance(address, str) else int(address)
-
-            if reg_type == "holding":
-                value = self.ui.get_value(id)
+            if modbus_planner.get_param_reg_type(param) in modbus_planner.WRITE_REG_TYPES:
+                value = self.ui.model.get(id)
                 if value == None:
                     continue
 
-                if "scale" in param:
-                    value = float(value) / param["scale"]
-
                 try:
-                    value = client.write_holding(slave_id, address, value)
-                    result.append((id, param, value))
-                except pymodbus.exceptions.ModbusIOException as e:
-                    raise RuntimeError(
-                        "Нет связи с устройством. Проверьте, что указан верный адрес устройства и выбран верный шаблон"
-                    ) from e
+                    if "scale" in param:
+                        value = float(value) / param["scale"]
+                    value = modbus_planner.cast_param_value(param, value)
+                    # значение должно помещаться в формат параметра (u16, s32, float...)
+                    modbus_planner.get_param_registers(param, value)
+                except ValueError:
+                    self.ui.write_log(
+                        f"Значение {value} параметра \"{self._template.translate(param['title'])}\" не подходит для его формата"
+                    )
+                    continue
+                values.append((id, param, value))
+
+        return values
 
-        return result
+    def write_params_to_modbus(self, client, slave_id, values, guard):
+        from pymodbus.exceptions import ModbusIOException
+
+        # прочитанные значения другого устройства не подходят для сравнения
+        device_values = self.device_values if self.device_values_key == (client.bus_key, slave_id) else {}
+
+        # значение в устройстве совпадает с указанным, записывать нечего
+        changed = [
+            (id, param, value)
+            for id, param, value in values
+            if id not in device_values
+            or not modbus_planner.is_same_param_value(param, device_values[id], value)
+        ]
+        skipped = len(values) - len(changed)
+
+        # соседние регистры записываются одной командой
+        try:
+            return self.write_planner.write(client, slave_id, changed, guard), skipped
+        except ModbusIOException as e:
+            raise RuntimeError(
+                "Нет связи с устройством. Проверьте, что указан верный адрес устройства и выбран верный шаблон"
+            ) from e
 
     def write_params_from_modbus_callback(self, result):
         try:
+            result, skipped = result
+            self.bind_device_values(self.io_device)
+
             failed = False
             for id, param, value in result:
                 if value is None:
+                    self.device_values.pop(id, None)
                     self.ui.write_log(
                         f"Не удалось записать параметр {self._template.translate(param['title'])} {param['address']}"
                     )
                     failed = True
+                else:
+                    self.device_values[id] = value
+
+            if skipped:
+                word = self.numeral_noun_declension(skipped, "параметр", "параметра", "параметров")
+                self.ui.write_log(f"Пропущено {skipped} {word} без изменений")
             if failed:
                 self.ui.write_log(
                     "Не удалось записать некоторые параметры. Возможно их нет в этой версии прошивки устройства. Такие параметры будут недоступны для редактирования."
@@ -492,18 +916,226 @@ class App:
             else:
                 self.ui.write_log("Запись параметров завершена.")
         finally:
-            self.client.disconnect()
+            self.sessions.release(self.client)
 
             with self.io_lock:
                 self.io_running = False
 
     def write_params_from_modbus_errback(self, error):
-        self.ui.write_log(f"Ошибка во время записи параметов: {error}")
-        self.client.disconnect()
+        if isinstance(error, (modbus_planner.OperationCancelled, tk_threading.CancelledError)):
+            self.ui.write_log("Запись параметров остановлена, часть параметров могла быть записана")
+            self.sessions.release(self.client)
+        else:
+            self.ui.write_log(f"Ошибка во время записи параметов: {error}")
+            self.sessions.invalidate(self.client)
+
+        with self.io_lock:
+            self.io_running = False
+
+    def btn_stop_click(self, event):
+        with self.io_lock:
+            running = self.io_running
+
+        if not running or self.io_task is None:
+            self.ui.write_log("Нет выполняемой операции чтения/записи")
+            return
+
+        # ещё не начатая операция отменяется сразу, рабочий поток проверяет отмену перед каждым запросом
+        if not self.io_task.cancel():
+            self.ui.write_log("Операция будет остановлена после текущего запроса")
+
+    def btn_batch_click(self, event):
+        if self._template is None:
+            self.ui.write_log("Сначала откройте шаблон")
+            return
+
+        window = self.ui.get_widget("nodel_batch_window")
+        if window is not None:
+            window.lift()
+            return
+
+        self.ui.create_batch_window()
+        self.ui.btn_batch_read.bind("<ButtonPress-1>", self.btn_batch_read_click)
+        self.ui.btn_batch_write.bind("<ButtonPress-1>", self.btn_batch_write_click)
+
+    def btn_batch_read_click(self, event):
+        self.start_batch("read")
+
+    def btn_batch_write_click(self, event):
+        self.start_batch("write")
+
+    def start_batch(self, operation):
+        with self.io_lock:
+            if self.io_running:
+                self.ui.write_log("Выполняется операция ввода/вывода, дождитесь завершения")
+                return
+
+        if self._template is None:
+            self.ui.write_log("Сначала откройте шаблон")
+            return
+
+        parameters = self._template.properties["device"]["parameters"]
+        if not parameters:
+            self.ui.write_log(f"Нет доступных для ректирования параметров")
+            return
+
+        mb_params = self.ui.get_modbus_params()
+        if mb_params is None or mb_params["mode"] not in ["RTU", "TCP", "RTU over TCP"]:
+            self.ui.write_log("Выбран неизвестный режим подключения!")
+            return
+
+        try:
+            slave_ids = batch_runner.parse_slave_ids(self.ui.get_value("nodel_batch_slave_ids"))
+            buses = batch_runner.parse_buses(self.ui.get_value("nodel_batch_buses"), mb_params)
+        except ValueError as e:
+            self.ui.write_log(str(e))
+            return
+
+        targets = [batch_runner.BatchTarget(bus, slave_id) for bus in buses for slave_id in slave_ids]
+
+        # порты открывает движок пакетного режима, одиночные соединения должны их освободить
+        self.sessions.close_all()
+        if self.engine is None:
+            from . import modbus_async  # asyncio и асинхронные клиенты нужны только пакетному режиму
+
+            self.engine = modbus_async.ModbusEngine(metrics=self.metrics)
+        cancel_token = modbus_planner.CancelToken()
+        runner = batch_runner.BatchRunner(
+            self.engine, self.read_planner, self.write_planner, cancel_token, self.max_timeouts
+        )
+
+        action = "Чтение" if operation == "read" else "Запись"
+        self.ui.write_log(f"{action} параметров {len(targets)} устройств в пакетном режиме")
+        self.io_task = tk_threading.TaskInThread(
+            self.ui.win,
+            runner.run,
+            kwargs={
+                "targets": targets,
+                "operation": operation,
+                "params": parameters,
+                "values": self.get_write_values(parameters),
+                "model": self._template.properties["device"]["name"],
+            },
+            callback=self.batch_callback,
+            errback=self.batch_errback,
+            cancel_token=cancel_token,
+        )
+
+        with self.io_lock:
+            self.io_running = True
+
+    def batch_callback(self, result):
+        try:
+            results, elapsed = result
+            elapsed = max(elapsed, 0.001)
+            self.engine.close_all()
+
+            rows = []
+            succeeded = 0
+            params_count = 0
+            for item in results:
+                if item.error is not None:
+                    status = f"Ошибка: {item.error}"
+                elif item.failed:
+                    status = "Есть ошибки"
+                elif item.mismatched:
+                    status = "Есть расхождения"
+                else:
+                    status = "OK"
+                    succeeded += 1
+                params_count += item.total
+                rows.append(
+                    (
+                        item.target.bus_name,
+                        item.target.slave_id,
+                        status,
+                        item.total,
+                        item.failed,
+                        item.mismatched,
+                        f"{item.duration:.2f}",
+                    )
+                )
+
+            summary = (
+                f"Устройств: {len(results)}, успешно: {succeeded}, время: {elapsed:.1f} с, "
+                f"{len(results) / elapsed * 60:.1f} устройств/мин, {params_count / elapsed:.1f} параметров/с"
+            )
+            if self.ui.is_exists_widget("nodel_batch_window"):
+                self.ui.show_batch_results(rows, summary)
+            self.ui.write_log(f"Пакетный режим завершён. {summary}")
+        finally:
+            with self.io_lock:
+                self.io_running = False
+
+    def batch_errback(self, error):
+        if isinstance(error, tk_threading.CancelledError):
+            self.ui.write_log("Пакетный режим остановлен")
+        else:
+            self.ui.write_log(f"Ошибка в пакетном режиме: {error}")
+        self.engine.close_all()
 
         with self.io_lock:
             self.io_running = False
 
+    def btn_stats_click(self, event):
+        window = self.ui.get_widget("nodel_stats_window")
+        if window is not None:
+            window.lift()
+            self.show_stats()
+            return
+
+        self.ui.create_stats_window()
+        self.ui.btn_stats_refresh.bind("<ButtonPress-1>", lambda event: self.show_stats())
+        self.ui.btn_stats_json.bind("<ButtonPress-1>", self.btn_stats_json_click)
+        self.ui.btn_stats_prometheus.bind("<ButtonPress-1>", self.btn_stats_prometheus_click)
+        self.ui.btn_stats_reset.bind("<ButtonPress-1>", self.btn_stats_reset_click)
+        self.show_stats()
+
+    def show_stats(self):
+        rows = []
+        for row in self.metrics.summary():
+            rows.append(
+                (
+                    row["bus"],
+                    row["slave_id"],
+                    row["firmware"] or "",
+                    row["function"],
+                    row["count"],
+                    row["ok"],
+                    row["exceptions"],
+                    row["timeouts"],
+                    row["errors"],
+                    row["repeated"],
+                    f"{row['avg_ms']:.1f}",
+                    "" if row["p95_ms"] is None else f"≤{row['p95_ms']:g}",
+                    row["sent_bytes"],
+                    row["received_bytes"],
+                )
+            )
+        self.ui.show_stats(rows)
+
+    def btn_stats_json_click(self, event):
+        self.save_stats(self.metrics.dump_json, ".json", "JSON")
+
+    def btn_stats_prometheus_click(self, event):
+        self.save_stats(self.metrics.dump_prometheus, ".prom", "Prometheus text format")
+
+    def save_stats(self, dump, extension, file_type):
+        file_path = self.ui.save_file("Сохранить статистику", extension, file_type)
+        if not file_path:
+            return
+
+        try:
+            dump(file_path)
+        except OSError as e:
+            self.ui.write_log(f"Не удалось сохранить статистику: {e}")
+            return
+        self.ui.write_log(f"Статистика сохранена в {file_path}")
+
+    def btn_stats_reset_click(self, event):
+        self.metrics.reset()
+        self.show_stats()
+
     # взято из интернета: https://ru.stackoverflow.com/a/1413836
     def numeral_noun_declension(self, number, nominative_singular, genetive_singular, nominative_plural):
         diglast = number % 10
@@ -519,7 +1151,11 @@ class App:
 
 
 def main(argv):
-    App()
+    report = None
+    if startup_report.FLAG in argv[1:]:
+        report = startup_report.start()  # если пакет загружен раньше без флага, импорты уже не замерить
+        report.mark("Модули загружены")
+    App(report)
 
 
 if __name__ == "__main__":
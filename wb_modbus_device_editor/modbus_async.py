@@ -0,0 +1,324 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+from pymodbus.client import AsyncModbusSerialClient, AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.framer.rtu_framer import ModbusRtuFramer
+from pymodbus.framer.socket_framer import ModbusSocketFramer
+
+from .modbus_client import (
+    BIT_REG_TYPES,
+    ILLEGAL_DATA_ADDRESS,
+    READ_FUNCTIONS,
+    REJECTED_EXCEPTIONS,
+    check_exception_reply,
+    get_bus_key,
+    get_bus_name,
+    get_port_key,
+)
+
+
+class AsyncModbusClient:
+    frame_overhead = 0  # bytes the framer adds to a PDU, for statistics
+
+    def __init__(self, mb_params):
+        self.client = None
+        self.mb_params = mb_params
+        self.bus_key = get_bus_key(mb_params)
+        self.bus_name = get_bus_name(mb_params)
+        self.metrics = None  # MetricsRegistry to record every transaction to
+
+    async def connect(self):
+        return await self.client.connect()
+
+    def disconnect(self):
+        self.client.close()
+
+    def is_connected(self):
+        return self.client.connected
+
+    async def read_holding(self, slave_id, reg_address):
+        registers = await self.read_holding_block(slave_id, reg_address, 1)
+        if registers is None:
+            return None
+        return registers[0]
+
+    async def read_holding_block(self, slave_id, reg_address, count):
+        return await self.read_block(slave_id, "holding", reg_address, count)
+
+    async def read_block(self, slave_id, reg_type, reg_address, count):
+        function, method = READ_FUNCTIONS[reg_type]
+        data = await self._execute(
+            function,
+            slave_id,
+            reg_address,
+            count,
+            5,
+            getattr(self.client, method)(address=reg_address, count=count, slave=slave_id),
+            rejected=(ILLEGAL_DATA_ADDRESS,),
+        )
+        if data is None:
+            return None
+        if reg_type in BIT_REG_TYPES:
+            # bits come packed in bytes, pymodbus unpacks the whole frame padded to 8 bits
+            return [int(bit) for bit in data.bits[:count]]
+        return data.registers[:count]
+
+    async def write_holding(self, slave_id, reg_address, value):
+        data = await self._execute(
+            "write_single",
+            slave_id,
+            reg_address,
+            1,
+            5,
+            self.client.write_register(address=reg_address, slave=slave_id, value=int(value)),
+        )
+        if data is None:
+            return None
+        return data.value
+
+    async def write_coil(self, slave_id, reg_address, value):
+        data = await self._execute(
+            "write_coil",
+            slave_id,
+            reg_address,
+            1,
+            5,
+            self.client.write_coil(address=reg_address, slave=slave_id, value=bool(value)),
+        )
+        if data is None:
+            return None
+        return int(data.value)
+
+    async def write_holding_block(self, slave_id, reg_address, values):
+        values = [int(value) for value in values]
+        data = await self._execute(
+            "write_multiple",
+            slave_id,
+            reg_address,
+            len(values),
+            6 + 2 * len(values),
+            self.client.write_registers(address=reg_address, slave=slave_id, values=values),
+        )
+        if data is None:  # FC16 may be not supported as well
+            return None
+        return values
+
+    async def _execute(
+        self, function, slave_id, reg_address, count, request_pdu, request, rejected=REJECTED_EXCEPTIONS
+    ):
+        start = time.monotonic()
+        try:
+            data = await request
+        except Exception as e:
+            self._record(function, slave_id, reg_address, count, start, request_pdu, error=e)
+            raise
+
+        if isinstance(data, Exception):  # in case pymodbus experiences an internal error (wrong slave id)
+            self._record(function, slave_id, reg_address, count, start, request_pdu, error=data)
+            raise data
+        self._record(function, slave_id, reg_address, count, start, request_pdu, response=data)
+        if data.isError() and not check_exception_reply(data, rejected):  # the device rejects the request
+            return None
+        return data
+
+    def _record(self, function, slave_id, reg_address, count, start, request_pdu, response=None, error=None):
+        if self.metrics is not None:
+            self.metrics.record(
+                self.bus_name,
+                slave_id,
+                function,
+                reg_address,
+                count,
+                time.monotonic() - start,
+                request_pdu,
+                self.frame_overhead,
+                response=response,
+                error=error,
+            )
+
+
+class AsyncModbusRTUClient(AsyncModbusClient):
+    frame_overhead = 3  # slave id and CRC
+
+    def __init__(self, mb_params):
+        super().__init__(mb_params)
+        self.client = AsyncModbusSerialClient(
+            port=mb_params["port"],
+            framer=ModbusRtuFramer,
+            baudrate=mb_params["baudrate"],
+            bytesize=mb_params["bytesize"],
+            parity=mb_params["parity"],
+            stopbits=mb_params["stopbits"],
+            strict=True,
+        )
+
+
+class AsyncModbusTCPClient(AsyncModbusClient):
+    frame_overhead = 7  # MBAP header
+
+    def __init__(self, mb_params):
+        super().__init__(mb_params)
+        self.client = AsyncModbusTcpClient(
+            host=mb_params["ip"], port=mb_params["port"], framer=ModbusSocketFramer
+        )
+
+
+class AsyncModbusRTUoverTCPClient(AsyncModbusClient):
+    frame_overhead = 3  # slave id and CRC
+
+    def __init__(self, mb_params):
+        super().__init__(mb_params)
+        self.client = AsyncModbusTcpClient(
+            host=mb_params["ip"], port=mb_params["port"], framer=ModbusRtuFramer
+        )
+
+
+def create_async_client(mb_params):
+    if mb_params["mode"] == "RTU":
+        return AsyncModbusRTUClient(mb_params)
+    if mb_params["mode"] == "TCP":
+        return AsyncModbusTCPClient(mb_params)
+    if mb_params["mode"] == "RTU over TCP":
+        return AsyncModbusRTUoverTCPClient(mb_params)
+    raise ValueError(f"Unknown modbus mode {mb_params['mode']}")
+
+
+class ModbusEngine:
+    """
+    Drives async clients of many buses from one event loop running in a background thread.
+    Different buses work concurrently, requests to the same bus are strictly sequential.
+    """
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self._loop = asyncio.new_event_loop()
+        self._clients = {}  # port key -> AsyncModbusClient
+        self._locks = {}  # port key -> asyncio.Lock, one request at a time on a physical bus
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def submit(self, coroutine):
+        """Schedules coroutine on the engine loop, returns concurrent.futures.Future"""
+        if self._stopped:
+            coroutine.close()
+            raise ConnectionError("Modbus engine is stopped")
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def client(self, mb_params):
+        return EngineClient(self, mb_params)
+
+    async def execute(self, mb_params, method, *args):
+        port_key = get_port_key(mb_params)
+        lock = self._locks.setdefault(port_key, asyncio.Lock())
+
+        async with lock:
+            client = await self._get_client(port_key, mb_params)
+            return await getattr(client, method)(*args)
+
+    async def connect(self, mb_params):
+        port_key = get_port_key(mb_params)
+        lock = self._locks.setdefault(port_key, asyncio.Lock())
+
+        async with lock:
+            client = await self._get_client(port_key, mb_params)
+            return client.is_connected()
+
+    async def _get_client(self, port_key, mb_params):
+        client = self._clients.get(port_key)
+
+        # the port is reopened if it is requested with other settings or the link is lost
+        if client is not None and (client.bus_key != get_bus_key(mb_params) or not client.is_connected()):
+            client.disconnect()
+            client = None
+            del self._clients[port_key]
+
+        if client is None:
+            client = create_async_client(mb_params)
+            client.metrics = self.metrics
+            if not await client.connect():
+                raise ConnectionError(f"Unable to connect to {port_key}")
+            self._clients[port_key] = client
+
+        return client
+
+    async def _close_all(self):
+        for client in self._clients.values():
+            client.disconnect()
+        self._clients.clear()
+
+    def close_all(self):
+        """Closes all connections, so the ports can be opened by somebody else"""
+        self.submit(self._close_all()).result()
+
+    async def _cancel_requests(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        self.close_all()
+        self._stopped = True
+        # threads waiting for requests in flight are woken up instead of waiting for the stopped loop forever
+        asyncio.run_coroutine_threadsafe(self._cancel_requests(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class EngineClient:
+    """Synchronous facade with ModbusClient API, so planners can drive a bus of the engine from a thread"""
+
+    # seconds to wait for a request with all its pymodbus retries, so a thread never waits for the engine forever
+    request_timeout = 60
+
+    def __init__(self, engine, mb_params):
+        self._engine = engine
+        self.mb_params = mb_params
+        self.bus_key = get_bus_key(mb_params)
+        self.bus_name = get_bus_name(mb_params)
+        self.metrics = engine.metrics
+
+    def _call(self, method, *args):
+        future = self._engine.submit(self._engine.execute(self.mb_params, method, *args))
+        return self._wait(future)
+
+    def _wait(self, future):
+        try:
+            return future.result(self.request_timeout)
+        except concurrent.futures.TimeoutError as e:
+            future.cancel()
+            raise ModbusIOException("No response from the modbus engine") from e
+        except concurrent.futures.CancelledError as e:
+            raise ConnectionError("Modbus engine is stopped") from e
+
+    def connect(self):
+        try:
+            return self._wait(self._engine.submit(self._engine.connect(self.mb_params)))
+        except (ConnectionError, ModbusIOException):
+            return False
+
+    def disconnect(self):
+        pass  # connections belong to the engine and stay open for other operations
+
+    def read_holding(self, slave_id, reg_address):
+        return self._call("read_holding", slave_id, reg_address)
+
+    def read_holding_block(self, slave_id, reg_address, count):
+        return self._call("read_holding_block", slave_id, reg_address, count)
+
+    def read_block(self, slave_id, reg_type, reg_address, count):
+        return self._call("read_block", slave_id, reg_type, reg_address, count)
+
+    def write_holding(self, slave_id, reg_address, value):
+        return self._call("write_holding", slave_id, reg_address, value)
+
+    def write_coil(self, slave_id, reg_address, value):
+        return self._call("write_coil", slave_id, reg_address, value)
+
+    def write_holding_block(self, slave_id, reg_address, values):
+        return self._call("write_holding_block", slave_id, reg_address, values)
@@ -1,19 +1,75 @@
 import logging
+import threading
+import time
 import traceback
 
-try:
-    from pymodbus.client import ModbusSerialClient, ModbusTcpClient
-except ImportError:
-    from pymodbus.client.sync import ModbusSerialClient, ModbusTcpClient
+READ_FUNCTIONS = {
+    # reg_type: (name for statistics, pymodbus client method)
+    "holding": ("read_holding", "read_holding_registers"),  # FC3
+    "input": ("read_input", "read_input_registers"),  # FC4
+    "coil": ("read_coil", "read_coils"),  # FC1
+    "discrete": ("read_discrete", "read_discrete_inputs"),  # FC2
+}
+BIT_REG_TYPES = ("coil", "discrete")
 
-from pymodbus.framer.rtu_framer import ModbusRtuFramer
-from pymodbus.framer.socket_framer import ModbusSocketFramer
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+GATEWAY_EXCEPTIONS = (0x0A, 0x0B)  # gateway path unavailable, target device failed to respond
+# the device doesn't support the request, so a write returns None instead of raising ExceptionReply
+REJECTED_EXCEPTIONS = (ILLEGAL_FUNCTION, ILLEGAL_DATA_ADDRESS, ILLEGAL_DATA_VALUE)
+
+
+def get_bus_key(mb_params):
+    # identifies connection to the bus (port or gateway with its settings) regardless of slave id
+    return tuple((key, value) for key, value in sorted(mb_params.items()) if key != "slave_id")
+
+
+def get_port_key(mb_params):
+    # identifies physical bus: serial port or gateway address
+    return mb_params.get("ip"), mb_params.get("port")
+
+
+def get_bus_name(mb_params):
+    # human readable connection name for statistics, e.g. "/dev/ttyUSB0 9600 8N2" or "TCP 10.0.0.5:502"
+    if mb_params["mode"] == "RTU":
+        return "{port} {baudrate} {bytesize}{parity}{stopbits}".format(**mb_params)
+    return "{mode} {ip}:{port}".format(**mb_params)
+
+
+class ExceptionReply(Exception):
+    """Exception response which says nothing about the request itself: device busy, failure, gateway errors"""
+
+    def __init__(self, code):
+        super().__init__(f"Exception response {code:#04x}")
+        self.code = code
+
+
+def check_exception_reply(data, rejected):
+    """Returns False for an exception response with one of rejected codes, raises ExceptionReply for others"""
+    if data.exception_code in rejected:
+        return False
+    raise ExceptionReply(data.exception_code)
+
+
+def _import_clients():
+    # pymodbus clients are imported on the first connection instead of the start of the program
+    try:
+        from pymodbus.client import ModbusSerialClient, ModbusTcpClient
+    except ImportError:
+        from pymodbus.client.sync import ModbusSerialClient, ModbusTcpClient
+    return ModbusSerialClient, ModbusTcpClient
 
 
 class ModbusClient:
+    frame_overhead = 0  # bytes the framer adds to a PDU, for statistics
 
     def __init__(self, mb_params):
         self.client = None
+        self.mb_params = mb_params
+        self.bus_key = get_bus_key(mb_params)
+        self.bus_name = get_bus_name(mb_params)
+        self.metrics = None  # MetricsRegistry to record every transaction to
 
     def connect(self):
         return self.client.connect()
@@ -21,27 +77,125 @@ class ModbusClient:
     def disconnect(self):
         self.client.close()
 
+    def is_connected(self):
+        return self.client.is_socket_open()
+
     def read_holding(self, slave_id, reg_address):
-        data = self.client.read_holding_registers(address=reg_address, unit=slave_id, slave=slave_id)
-        if isinstance(data, Exception):  # in case pymodbus experiences an internal error (wrong slave id)
-            raise data
-        if data.isError():  # in case device reports a problem (wrong reg addr)
+        registers = self.read_holding_block(slave_id, reg_address, 1)
+        if registers is None:
+            return None
+        return registers[0]
+
+    def read_holding_block(self, slave_id, reg_address, count):
+        return self.read_block(slave_id, "holding", reg_address, count)
+
+    def read_block(self, slave_id, reg_type, reg_address, count):
+        function, method = READ_FUNCTIONS[reg_type]
+
+        def request():
+            return getattr(self.client, method)(
+                address=reg_address, count=count, unit=slave_id, slave=slave_id
+            )
+
+        data = self._execute(
+            function,
+            slave_id,
+            reg_address,
+            count,
+            5,
+            request,
+            # only a missing register makes the block fail, busy or gateway errors are temporary
+            rejected=(ILLEGAL_DATA_ADDRESS,),
+        )
+        if data is None:
             return None
-        return data.registers[0]
+        if reg_type in BIT_REG_TYPES:
+            # bits come packed in bytes, pymodbus unpacks the whole frame padded to 8 bits
+            return [int(bit) for bit in data.bits[:count]]
+        return data.registers[:count]
 
     def write_holding(self, slave_id, reg_address, value):
-        data = self.client.write_register(
-            address=reg_address, unit=slave_id, slave=slave_id, value=int(value)
+        data = self._execute(
+            "write_single",
+            slave_id,
+            reg_address,
+            1,
+            5,
+            lambda: self.client.write_register(
+                address=reg_address, unit=slave_id, slave=slave_id, value=int(value)
+            ),
         )
+        if data is None:
+            return None
+        return data.value
+
+    def write_coil(self, slave_id, reg_address, value):
+        def request():
+            return self.client.write_coil(
+                address=reg_address, unit=slave_id, slave=slave_id, value=bool(value)
+            )
+
+        data = self._execute("write_coil", slave_id, reg_address, 1, 5, request)
+        if data is None:
+            return None
+        return int(data.value)
+
+    def write_holding_block(self, slave_id, reg_address, values):
+        values = [int(value) for value in values]
+        data = self._execute(
+            "write_multiple",
+            slave_id,
+            reg_address,
+            len(values),
+            6 + 2 * len(values),
+            lambda: self.client.write_registers(
+                address=reg_address, unit=slave_id, slave=slave_id, values=values
+            ),
+        )
+        if data is None:  # FC16 may be not supported as well
+            return None
+        return values
+
+    def _execute(
+        self, function, slave_id, reg_address, count, request_pdu, request, rejected=REJECTED_EXCEPTIONS
+    ):
+        start = time.monotonic()
+        try:
+            data = request()
+        except Exception as e:
+            self._record(function, slave_id, reg_address, count, start, request_pdu, error=e)
+            raise
+
         if isinstance(data, Exception):  # in case pymodbus experiences an internal error (wrong slave id)
+            self._record(function, slave_id, reg_address, count, start, request_pdu, error=data)
             raise data
-        if data.isError():  # in case device reports a problem (wrong reg addr)
+        self._record(function, slave_id, reg_address, count, start, request_pdu, response=data)
+        if data.isError() and not check_exception_reply(data, rejected):  # the device rejects the request
             return None
-        return data.value
+        return data
+
+    def _record(self, function, slave_id, reg_address, count, start, request_pdu, response=None, error=None):
+        if self.metrics is not None:
+            self.metrics.record(
+                self.bus_name,
+                slave_id,
+                function,
+                reg_address,
+                count,
+                time.monotonic() - start,
+                request_pdu,
+                self.frame_overhead,
+                response=response,
+                error=error,
+            )
 
 
 class ModbusRTUClient(ModbusClient):
+    frame_overhead = 3  # slave id and CRC
+
     def __init__(self, mb_params):
+        super().__init__(mb_params)
+        ModbusSerialClient, _ = _import_clients()
         self.client = ModbusSerialClient(
             method="rtu",
             port=mb_params["port"],
@@ -54,10 +208,108 @@ class ModbusRTUClient(ModbusClient):
 
 
 class ModbusTCPClient(ModbusClient):
+    frame_overhead = 7  # MBAP header
+
     def __init__(self, mb_params):
+        super().__init__(mb_params)
+        from pymodbus.framer.socket_framer import ModbusSocketFramer
+
+        _, ModbusTcpClient = _import_clients()
         self.client = ModbusTcpClient(host=mb_params["ip"], port=mb_params["port"], framer=ModbusSocketFramer)
 
 
 class ModbusRTUoverTCPClient(ModbusClient):
+    frame_overhead = 3  # slave id and CRC
+
     def __init__(self, mb_params):
+        super().__init__(mb_params)
+        from pymodbus.framer.rtu_framer import ModbusRtuFramer
+
+        _, ModbusTcpClient = _import_clients()
         self.client = ModbusTcpClient(host=mb_params["ip"], port=mb_params["port"], framer=ModbusRtuFramer)
+
+
+def create_client(mb_params):
+    if mb_params["mode"] == "RTU":
+        return ModbusRTUClient(mb_params)
+    if mb_params["mode"] == "TCP":
+        return ModbusTCPClient(mb_params)
+    if mb_params["mode"] == "RTU over TCP":
+        return ModbusRTUoverTCPClient(mb_params)
+    raise ValueError(f"Unknown modbus mode {mb_params['mode']}")
+
+
+class ModbusSessionManager:
+    """Keeps connections open between operations instead of opening a port for every one of them"""
+
+    def __init__(self, idle_timeout=60, metrics=None):
+        self.idle_timeout = idle_timeout  # seconds an unused connection stays open
+        self.metrics = metrics
+        self._sessions = {}  # bus key -> ModbusClient
+        self._timers = {}  # bus key -> idle timer
+        self._lock = threading.Lock()
+
+    def acquire(self, mb_params):
+        """Returns connected client for mb_params or None if connection can't be opened"""
+        key = get_bus_key(mb_params)
+        with self._lock:
+            self._stop_timer(key)
+
+            client = self._sessions.get(key)
+            if client is not None and not client.is_connected():  # health check, reconnect if link is lost
+                self._close(key)
+                client = None
+
+            if client is None:
+                # the same port may be opened with other settings, it has to be released first
+                for other_key, other in list(self._sessions.items()):
+                    if get_port_key(other.mb_params) == get_port_key(mb_params):
+                        self._close(other_key)
+
+                client = create_client(mb_params)
+                client.metrics = self.metrics
+                if not client.connect():
+                    return None
+                self._sessions[key] = client
+
+            return client
+
+    def release(self, client):
+        """Operation is finished, the connection is closed if not used for idle_timeout"""
+        with self._lock:
+            if self._sessions.get(client.bus_key) is not client:
+                return
+            self._stop_timer(client.bus_key)
+            timer = threading.Timer(self.idle_timeout, self._expire, args=(client,))
+            timer.daemon = True
+            self._timers[client.bus_key] = timer
+            timer.start()
+
+    def invalidate(self, client):
+        """Connection state is unknown after an error, the next acquire opens a new one"""
+        with self._lock:
+            if self._sessions.get(client.bus_key) is client:
+                self._close(client.bus_key)
+            else:
+                client.disconnect()
+
+    def close_all(self):
+        with self._lock:
+            for key in list(self._sessions):
+                self._close(key)
+
+    def _expire(self, client):
+        with self._lock:
+            # the timer could be stopped by acquire while waiting for the lock
+            if self._timers.get(client.bus_key) is threading.current_thread():
+                self._close(client.bus_key)
+
+    def _stop_timer(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _close(self, key):
+        self._stop_timer(key)
+        client = self._sessions.pop(key)
+        client.disconnect()
@@ -0,0 +1,113 @@
+import array
+import struct
+import sys
+
+FORMATS = {
+    # template format: struct code of the value with big endian words and bytes
+    "u8": "xB",  # low byte of the register
+    "s8": "xb",
+    "u16": "H",
+    "s16": "h",
+    "u32": "I",
+    "s32": "i",
+    "u64": "Q",
+    "s64": "q",
+    "float": "f",
+    "double": "d",
+}
+FLOAT_FORMATS = ("float", "double")
+DEFAULT_FORMAT = "u16"  # other formats of wb-mqtt-serial (bcd, char8, string) are shown as raw registers
+
+
+class ValueFormat:
+    """Converts a value of some format and word/byte order to registers and back"""
+
+    def __init__(self, format, word_order="big_endian", byte_order="big_endian"):
+        self.format = format if format in FORMATS else DEFAULT_FORMAT
+        self.struct = struct.Struct(">" + FORMATS[self.format])
+        self.width = self.struct.size // 2  # registers per value
+        self.swap_words = word_order == "little_endian" and self.width > 1
+        self.swap_bytes = byte_order == "little_endian"
+        self.is_float = self.format in FLOAT_FORMATS
+
+    @property
+    def is_raw(self):
+        # the value is the register itself, no conversion is needed
+        return self.format == DEFAULT_FORMAT and not self.swap_bytes
+
+    def cast(self, value):
+        if self.is_float:
+            return float(value)
+        # int() keeps every digit of 64-bit values, a fractional value ("1.5", "1e3") goes through float
+        try:
+            return int(value)
+        except ValueError:
+            return int(float(value))
+
+    def unpack(self, data, offset):
+        """data is big endian bytes of registers (little endian if swap_bytes), offset in bytes"""
+        if self.swap_words:
+            words = array.array("H", data[offset : offset + self.struct.size])
+            words.reverse()
+            return self.struct.unpack(words.tobytes())[0]
+        return self.struct.unpack_from(data, offset)[0]
+
+    def encode(self, value):
+        """Returns registers of the value, raises ValueError if the value doesn't fit the format"""
+        try:
+            data = self.struct.pack(self.cast(value))
+        except struct.error as e:
+            raise ValueError(f"Value {value} doesn't fit {self.format}") from e
+
+        words = array.array("H", data)
+        if self.swap_words:
+            words.reverse()
+        if self.swap_bytes == (sys.byteorder == "big"):
+            words.byteswap()
+        return words.tolist()
+
+
+_formats = {}  # (format, word_order, byte_order) -> ValueFormat
+
+
+def get_value_format(param):
+    key = (
+        param.get("format", DEFAULT_FORMAT),
+        param.get("word_order", "big_endian"),
+        param.get("byte_order", "big_endian"),
+    )
+    value_format = _formats.get(key)
+    if value_format is None:
+        value_format = _formats[key] = ValueFormat(*key)
+    return value_format
+
+
+def registers_to_bytes(registers, byte_order="big_endian"):
+    words = array.array("H", registers)
+    if (byte_order == "big_endian") == (sys.byteorder == "little"):
+        words.byteswap()
+    return words.tobytes()
+
+
+def decode_block(start, registers, params):
+    """
+    Converts registers read from start address to values of all params of the block at once,
+    params are (id, param, address) tuples, returns list of (id, param, value)
+    """
+    result = []
+    buffers = {}  # byte order -> registers as bytes, built once for the whole block
+
+    for id, param, address in params:
+        value_format = get_value_format(param)
+        offset = address - start
+        if value_format.is_raw:
+            result.append((id, param, registers[offset]))
+            continue
+
+        byte_order = "little_endian" if value_format.swap_bytes else "big_endian"
+        data = buffers.get(byte_order)
+        if data is None:
+            data = buffers[byte_order] = registers_to_bytes(registers, byte_order)
+        result.append((id, param, value_format.unpack(data, offset * 2)))
+
+    return result
@@ -0,0 +1,253 @@
+import collections
+import json
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+SIZE_BUCKETS = (8, 16, 32, 64, 128, 256)  # bytes on the wire
+
+# requests of one family repeat each other, e.g. FC6 writes after a rejected FC16 write
+REPEAT_FAMILIES = {"write_single": "write", "write_multiple": "write"}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket containing q-quantile, None for +Inf or no data"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return None
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+    def to_dict(self):
+        return {
+            "buckets": {str(bound): count for bound, count in self.cumulative()},
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+class TransactionStats:
+    def __init__(self):
+        self.outcomes = collections.Counter()  # ok, exception, timeout, error
+        self.exception_codes = collections.Counter()
+        # requests covering registers of a recently failed one: bisection, FC6 fallback, next read.
+        # Retries inside pymodbus are not visible here
+        self.repeated = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.request_size = Histogram(SIZE_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+
+    def to_dict(self):
+        return {
+            "outcomes": dict(self.outcomes),
+            "exception_codes": {str(code): count for code, count in self.exception_codes.items()},
+            "repeated_after_failure": self.repeated,
+            "latency_seconds": self.latency.to_dict(),
+            "request_bytes": self.request_size.to_dict(),
+            "response_bytes": self.response_size.to_dict(),
+        }
+
+
+class MetricsRegistry:
+    """Per-transaction bus statistics aggregated per connection, slave and function"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}  # (bus, slave_id, function) -> TransactionStats
+            self._firmwares = {}  # (bus, slave_id) -> firmware version
+            self._failed_ranges = {}  # (bus, slave_id, family) -> recently failed (start, end) ranges
+            self.started = time.time()
+
+    def set_firmware(self, bus, slave_id, firmware):
+        with self._lock:
+            self._firmwares[(bus, slave_id)] = firmware
+
+    def record(
+        self,
+        bus,
+        slave_id,
+        function,
+        address,
+        count,
+        latency,
+        request_pdu,
+        framing,
+        response=None,
+        error=None,
+    ):
+        """
+        Records one transaction. request_pdu is the request size without framing,
+        response is pymodbus response (or None if error is set), error is the raised exception.
+        """
+        # pymodbus is already loaded by the client which made the request
+        from pymodbus.exceptions import ModbusIOException
+
+        if error is not None:
+            outcome = "timeout" if isinstance(error, ModbusIOException) else "error"
+            response_size = 0
+        else:
+            outcome = "exception" if response.isError() else "ok"
+            response_size = 1 + len(response.encode()) + framing  # function code + data + framing
+        failed = outcome != "ok"
+
+        with self._lock:
+            stats = self._stats.setdefault((bus, slave_id, function), TransactionStats())
+            stats.outcomes[outcome] += 1
+            if outcome == "exception":
+                stats.exception_codes[response.exception_code] += 1
+
+            family = (bus, slave_id, REPEAT_FAMILIES.get(function, function))
+            failed_ranges = self._failed_ranges.setdefault(family, collections.deque(maxlen=32))
+            if any(start <= address and address + count <= end for start, end in failed_ranges):
+                stats.repeated += 1
+            if failed:
+                failed_ranges.append((address, address + count))
+
+            stats.latency.observe(latency)
+            stats.request_size.observe(request_pdu + framing)
+            if response_size:
+                stats.response_size.observe(response_size)
+
+    def summary(self):
+        """Rows for the statistics table, one per connection, slave and function"""
+        rows = []
+        with self._lock:
+            for (bus, slave_id, function), stats in sorted(self._stats.items(), key=str):
+                latency = stats.latency
+                p95 = latency.quantile(0.95)
+                rows.append(
+                    {
+                        "bus": bus,
+                        "slave_id": slave_id,
+                        "firmware": self._firmwares.get((bus, slave_id)),
+                        "function": function,
+                        "count": latency.count,
+                        "ok": stats.outcomes["ok"],
+                        "exceptions": stats.outcomes["exception"],
+                        "timeouts": stats.outcomes["timeout"],
+                        "errors": stats.outcomes["error"],
+                        "repeated": stats.repeated,
+                        "avg_ms": latency.sum / latency.count * 1000,
+                        "p95_ms": None if p95 is None else p95 * 1000,
+                        "sent_bytes": int(stats.request_size.sum),
+                        "received_bytes": int(stats.response_size.sum),
+                    }
+                )
+        return rows
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "dumped": time.time(),
+                "devices": [
+                    {"bus": bus, "slave_id": slave_id, "firmware": firmware}
+                    for (bus, slave_id), firmware in sorted(self._firmwares.items(), key=str)
+                ],
+                "transactions": [
+                    {"bus": bus, "slave_id": slave_id, "function": function, **stats.to_dict()}
+                    for (bus, slave_id, function), stats in sorted(self._stats.items(), key=str)
+                ],
+            }
+
+    def dump_json(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        data = self.to_dict()
+        lines = []
+
+        def labels(item, **extra):
+            pairs = {"bus": item["bus"], "slave": item["slave_id"], **extra}
+            return ",".join(f'{key}="{_escape_label(value)}"' for key, value in pairs.items())
+
+        lines.append("# HELP wb_modbus_device_info Firmware version of polled devices")
+        lines.append("# TYPE wb_modbus_device_info gauge")
+        for device in data["devices"]:
+            lines.append(f"wb_modbus_device_info{{{labels(device, firmware=device['firmware'] or '')}}} 1")
+
+        lines.append("# HELP wb_modbus_transactions_total Modbus transactions by outcome")
+        lines.append("# TYPE wb_modbus_transactions_total counter")
+        for item in data["transactions"]:
+            for outcome, count in item["outcomes"].items():
+                lines.append(
+                    f"wb_modbus_transactions_total{{{labels(item, function=item['function'], outcome=outcome)}}} "
+                    f"{count}"
+                )
+
+        lines.append("# HELP wb_modbus_exceptions_total Modbus exception responses by exception code")
+        lines.append("# TYPE wb_modbus_exceptions_total counter")
+        for item in data["transactions"]:
+            for code, count in item["exception_codes"].items():
+                lines.append(
+                    f"wb_modbus_exceptions_total{{{labels(item, function=item['function'], code=code)}}} {count}"
+                )
+
+        lines.append(
+            "# HELP wb_modbus_repeated_requests_total Requests covering registers of a recently failed one"
+        )
+        lines.append("# TYPE wb_modbus_repeated_requests_total counter")
+        for item in data["transactions"]:
+            lines.append(
+                f"wb_modbus_repeated_requests_total{{{labels(item, function=item['function'])}}} "
+                f"{item['repeated_after_failure']}"
+            )
+
+        for name, key, help_text in (
+            ("wb_modbus_transaction_duration_seconds", "latency_seconds", "Modbus transaction latency"),
+            ("wb_modbus_request_size_bytes", "request_bytes", "Modbus request size with framing"),
+            ("wb_modbus_response_size_bytes", "response_bytes", "Modbus response size with framing"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for item in data["transactions"]:
+                histogram = item[key]
+                for bound, count in histogram["buckets"].items():
+                    le = "+Inf" if bound == "inf" else bound
+                    lines.append(f"{name}_bucket{{{labels(item, function=item['function'], le=le)}}} {count}")
+                lines.append(f"{name}_sum{{{labels(item, function=item['function'])}}} {histogram['sum']}")
+                lines.append(
+                    f"{name}_count{{{labels(item, function=item['function'])}}} {histogram['count']}"
+                )
+
+        return "\n".join(lines) + "\n"
+
+    def dump_prometheus(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,364 @@
+import threading
+
+from . import modbus_formats
+from .modbus_client import BIT_REG_TYPES, GATEWAY_EXCEPTIONS, READ_FUNCTIONS, ExceptionReply
+
+MAX_READ_REGISTERS = 125  # protocol limit for a single FC3/FC4 request
+MAX_READ_BITS = 2000  # protocol limit for a single FC1/FC2 request
+MAX_WRITE_REGISTERS = 123  # protocol limit for a single FC16 request
+
+READ_REG_TYPES = tuple(READ_FUNCTIONS)
+WRITE_REG_TYPES = ("holding", "coil")  # input registers and discrete inputs are read only
+
+FW_VERSION_ADDRESS = 250  # firmware version string of Wiren Board devices
+FW_VERSION_LENGTH = 16
+
+
+def get_param_address(param):
+    # addresses are written either in hex or in dec strings
+    address = param["address"]
+    return int(address, 0) if isinstance(address, str) else int(address)
+
+
+def get_param_reg_type(param):
+    # reg_type may be omitted in the template, holding is the default
+    return param.get("reg_type") or "holding"
+
+
+def get_param_width(param):
+    # multi-register formats (u32, float, ...) occupy several registers starting from the address
+    if get_param_reg_type(param) in BIT_REG_TYPES:
+        return 1
+    return modbus_formats.get_value_format(param).width
+
+
+# returned by TransactionGuard.call for a tolerated timeout or a temporary exception response (busy, gateway)
+TIMEOUT = object()
+
+
+class OperationCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    """Set from the UI thread to stop a running operation between requests"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class TransactionGuard:
+    """
+    Runs every request of an operation: checks cancellation before the request
+    and aborts the operation after max_timeouts consecutive timeouts, e.g. if the device is absent.
+    Gateway exception responses (0x0A, 0x0B) are counted as timeouts.
+    """
+
+    def __init__(self, cancel_token=None, max_timeouts=1):
+        self.cancel_token = cancel_token
+        self.max_timeouts = max_timeouts
+        self._timeouts = 0
+
+    def call(self, func, *args):
+        # pymodbus is imported by the clients on the first connection, not at the start of the program
+        from pymodbus.exceptions import ModbusIOException
+
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            raise OperationCancelled("Operation is cancelled")
+
+        try:
+            result = func(*args)
+        except ModbusIOException:
+            self._timeouts += 1
+            if self._timeouts >= self.max_timeouts:
+                raise
+            return TIMEOUT
+        except ExceptionReply as e:
+            if e.code not in GATEWAY_EXCEPTIONS:
+                # the device answers, but the reply says nothing about the registers
+                self._timeouts = 0
+                return TIMEOUT
+
+            # a gateway answers instead of an absent device, e.g. with a wrong slave id
+            self._timeouts += 1
+            if self._timeouts >= self.max_timeouts:
+                raise ModbusIOException(f"Gateway exception response {e.code:#04x}") from e
+            return TIMEOUT
+
+        self._timeouts = 0
+        return result
+
+
+def read_firmware_version(client, slave_id, guard):
+    # the version only tells apart register maps of a device model, so exception responses are not important;
+    # the probe is the first request of the operation, its timeout counts against the operation's guard
+    registers = guard.call(client.read_holding_block, slave_id, FW_VERSION_ADDRESS, FW_VERSION_LENGTH)
+
+    if registers is None or registers is TIMEOUT:
+        return None
+    version = "".join(chr(register) for register in registers).split("\0")[0]
+
+    if client.metrics is not None:
+        client.metrics.set_firmware(client.bus_name, slave_id, version)
+    return version
+
+
+def get_param_registers(param, value):
+    """Converts a value to registers of the parameter, raises ValueError if it doesn't fit the format"""
+    if get_param_reg_type(param) in BIT_REG_TYPES:
+        return [int(bool(value))]
+    return modbus_formats.get_value_format(param).encode(value)
+
+
+def cast_param_value(param, value):
+    # float formats keep the fraction, integer ones are truncated like before
+    if get_param_reg_type(param) in BIT_REG_TYPES:
+        return int(float(value))
+    return modbus_formats.get_value_format(param).cast(value)
+
+
+def is_same_param_value(param, first, second):
+    # values are compared as registers, e.g. a float read from the device and the one typed in the editor
+    try:
+        return get_param_registers(param, first) == get_param_registers(param, second)
+    except ValueError:
+        return False
+
+
+class RegisterBlock:
+    def __init__(self, reg_type, address):
+        self.reg_type = reg_type
+        self.address = address
+        self.count = 0
+        self.params = []  # (id, param, address) tuples served by this block
+        self.values = []  # register values of a write block, one per register
+
+    @property
+    def end(self):
+        return self.address + self.count
+
+    def add(self, id, param, address, width=1):
+        self.params.append((id, param, address))
+        self.count = max(self.count, address + width - self.address)
+
+
+class DeviceRegisterMap:
+    """Registers known to be missing on some device model and firmware"""
+
+    def __init__(self):
+        self.holes = set()  # (reg_type, address) of registers the device answers with illegal data address
+        self.breaks = set()  # (reg_type, address) a block must not be extended to across a gap
+
+
+class ReadPlanner:
+    """Merges parameter addresses into blocks so that one request reads many registers"""
+
+    def __init__(self, max_gap=0, max_count=MAX_READ_REGISTERS, max_bits=MAX_READ_BITS):
+        self.max_gap = max_gap  # how many unused registers may be read to join two neighbours
+        self.max_count = max_count
+        self.max_bits = max_bits  # coils and discrete inputs are packed 8 per byte, so a frame holds more
+        self._device_maps = {}  # device signature (model, firmware) -> DeviceRegisterMap
+
+    def get_device_map(self, signature):
+        # holes found on a device of unknown firmware (or a wrong slave id) aren't applied to other devices
+        if signature is None or not signature[1]:
+            return DeviceRegisterMap()
+        return self._device_maps.setdefault(signature, DeviceRegisterMap())
+
+    def _can_join(self, block, reg_type, address, width, device_map):
+        max_count = self.max_bits if reg_type in BIT_REG_TYPES else self.max_count
+        if address - block.end > self.max_gap or address + width - block.address > max_count:
+            return False
+        if (reg_type, address) in device_map.breaks:
+            return False
+        # a known hole inside the gap would fail the whole block
+        return not any((reg_type, gap) in device_map.holes for gap in range(block.end, address))
+
+    def plan(self, params, reg_types=READ_REG_TYPES, device_map=None):
+        if device_map is None:
+            device_map = DeviceRegisterMap()
+
+        by_type = {}
+        for id, param in params.items():
+            # parameters without address can only be set from outside and can't be read
+            if param.get("address") is None:
+                continue
+
+            reg_type = get_param_reg_type(param)
+            if reg_type in reg_types:
+                by_type.setdefault(reg_type, []).append((get_param_address(param), id, param))
+
+        blocks = []
+        for reg_type, items in by_type.items():
+            items.sort(key=lambda item: item[0])
+
+            block = None
+            for address, id, param in items:
+                if (reg_type, address) in device_map.holes:
+                    continue
+                width = get_param_width(param)
+                if block is None or not self._can_join(block, reg_type, address, width, device_map):
+                    block = RegisterBlock(reg_type, address)
+                    blocks.append(block)
+                block.add(id, param, address, width)
+
+        return blocks
+
+    def read(self, client, slave_id, params, signature=None, priority=None, on_block=None, guard=None):
+        """
+        Reads params, returns list of (id, param, value), value is None if the register is missing.
+        Blocks with params from priority are read first, on_block(result, done, total) is called
+        after every block so that values can be shown before the whole read is finished.
+        """
+        device_map = self.get_device_map(signature)
+        if guard is None:
+            guard = TransactionGuard()
+        result = []
+
+        # registers found missing earlier are not requested again
+        for id, param in params.items():
+            if param.get("address") is None:
+                continue
+            if get_param_reg_type(param) not in READ_REG_TYPES:
+                continue
+            if (get_param_reg_type(param), get_param_address(param)) in device_map.holes:
+                result.append((id, param, None))
+
+        blocks = self.plan(params, device_map=device_map)
+        if priority:
+            blocks.sort(key=lambda block: not any(id in priority for id, param, address in block.params))
+
+        if on_block is not None and result:
+            on_block(list(result), 0, len(blocks))
+
+        for done, block in enumerate(blocks, start=1):
+            block_result, _ = self._read_block(client, slave_id, block, device_map, guard)
+            result.extend(block_result)
+            if on_block is not None:
+                on_block(block_result, done, len(blocks))
+
+        return result
+
+    def _read_block(self, client, slave_id, block, device_map, guard):
+        registers = guard.call(client.read_block, slave_id, block.reg_type, block.address, block.count)
+        if registers is TIMEOUT:
+            # the device didn't answer, it says nothing about missing registers
+            return [(id, param, None) for id, param, address in block.params], False
+        if registers is not None:
+            if block.reg_type in BIT_REG_TYPES:
+                values = [
+                    (id, param, registers[address - block.address]) for id, param, address in block.params
+                ]
+            else:
+                values = modbus_formats.decode_block(block.address, registers, block.params)
+            return values, True
+
+        addresses = sorted({address for id, param, address in block.params})
+        if len(addresses) == 1:
+            device_map.holes.add((block.reg_type, block.address))
+            return [(id, param, None) for id, param, address in block.params], False
+
+        # bisect the failed block to find missing registers in O(k log n) requests
+        middle = addresses[len(addresses) // 2]
+        left = RegisterBlock(block.reg_type, block.address)
+        right = RegisterBlock(block.reg_type, middle)
+        for id, param, address in block.params:
+            (left if address < middle else right).add(id, param, address, get_param_width(param))
+
+        left_result, left_ok = self._read_block(client, slave_id, left, device_map, guard)
+        right_result, right_ok = self._read_block(client, slave_id, right, device_map, guard)
+        if left_ok and right_ok:
+            # both halves are readable alone, so the device rejects the gap between them
+            device_map.breaks.add((block.reg_type, middle))
+
+        return left_result + right_result, False
+
+
+class WritePlanner:
+    """
+    Groups adjacent registers into FC16 requests, falls back to FC6 for devices that reject FC16.
+    Coils are written one by one with FC5.
+    """
+
+    def __init__(self, max_count=MAX_WRITE_REGISTERS):
+        self.max_count = max_count
+        self._single_write_devices = set()  # (bus key, slave id) of devices which don't accept FC16
+
+    def plan(self, values):
+        # values are converted to registers here, so they have to fit their formats (see get_param_registers)
+        items = []
+        for id, param, value in values:
+            reg_type = get_param_reg_type(param)
+            if reg_type in WRITE_REG_TYPES:
+                items.append((reg_type, get_param_address(param), id, param, value))
+        items.sort(key=lambda item: item[:2])
+
+        blocks = []
+        block = None
+        for reg_type, address, id, param, value in items:
+            registers = get_param_registers(param, value)
+            # FC16 writes every register of the range, so only gapless neighbours can be joined
+            if (
+                block is None
+                or reg_type != "holding"
+                or block.reg_type != reg_type
+                or address != block.end
+                or block.count + len(registers) > self.max_count
+            ):
+                block = RegisterBlock(reg_type, address)
+                blocks.append(block)
+            block.add(id, param, address, len(registers))
+            block.values.extend(registers)
+
+        return blocks
+
+    def write(self, client, slave_id, values, guard=None):
+        """Writes (id, param, value) values, returns list of (id, param, value), value is None on failure"""
+        result = []
+        device = (client.bus_key, slave_id)
+        written_values = {id: value for id, param, value in values}
+        if guard is None:
+            guard = TransactionGuard()
+
+        for block in self.plan(values):
+            multiple = len(block.params) > 1
+            if multiple and device not in self._single_write_devices:
+                written = guard.call(client.write_holding_block, slave_id, block.address, block.values)
+                if written is TIMEOUT:
+                    result.extend((id, param, None) for id, param, address in block.params)
+                    continue
+                if written is not None:
+                    result.extend((id, param, written_values[id]) for id, param, address in block.params)
+                    continue
+
+            # either the block has one parameter or FC16 failed and each parameter has to be written alone
+            block_result = []
+            single_results = []  # results of FC6 writes, a multi-register value fails without FC16 anyway
+            for id, param, address in block.params:
+                offset = address - block.address
+                registers = block.values[offset : offset + get_param_width(param)]
+                if block.reg_type == "coil":
+                    written = guard.call(client.write_coil, slave_id, address, registers[0])
+                elif len(registers) == 1:
+                    written = guard.call(client.write_holding, slave_id, address, registers[0])
+                else:
+                    # a multi-register value can only be written with FC16
+                    written = guard.call(client.write_holding_block, slave_id, address, registers)
+                ok = written is not None and written is not TIMEOUT
+                if block.reg_type == "holding" and len(registers) == 1:
+                    single_results.append(ok)
+                block_result.append((id, param, written_values[id] if ok else None))
+            result.extend(block_result)
+
+            # registers are writable one by one, so it's FC16 the device doesn't accept
+            if multiple and single_results and all(single_results):
+                self._single_write_devices.add(device)
+
+        return result
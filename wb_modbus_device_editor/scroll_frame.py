@@ -83,3 +83,121 @@ class ScrollFrame(tkinter.Frame):
             self.canvas.unbind_all("<Button-5>")
         else:
             self.canvas.unbind_all("<MouseWheel>")
+
+
+# ************************
+# Virtual Scrollable List Class
+# ************************
+
+
+class VirtualScrollFrame(tkinter.Frame):
+    """
+    Scrollable list of rows of the same height. Widgets exist only for the rows in the visible part
+    of the canvas and a margin around it, they are reused for other rows while scrolling.
+    create_row(parent) creates a widget for a row, bind_row(widget, item) shows an item in it,
+    unbind_row(widget, item) is called before the widget is reused for another item.
+    """
+
+    def __init__(self, parent, create_row, bind_row, unbind_row=None, margin=10, row_padding=6):
+        super().__init__(parent)
+        self.create_row = create_row
+        self.bind_row = bind_row
+        self.unbind_row = unbind_row
+        self.margin = margin  # rows kept above and below the visible ones
+        self.row_padding = row_padding  # space around the tallest widget of a row
+        self.row_height = None  # measured on the first row widget
+        self.items = []
+        self._shown = {}  # row index -> (widget, canvas window)
+        self._pool = []  # (widget, canvas window) not bound to any row
+
+        self.canvas = tkinter.Canvas(self, borderwidth=0, highlightthickness=0)
+        self.vsb = tkinter.Scrollbar(self, orient="vertical", command=self.yview)
+        # the scroll position is known only to the canvas, rows are updated whenever it changes
+        self.canvas.configure(yscrollcommand=self.onScroll)
+
+        self.vsb.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.canvas.bind("<Configure>", self.onCanvasConfigure)
+        self.bind("<Enter>", self.onEnter)
+        self.bind("<Leave>", self.onLeave)
+
+    onMouseWheel = ScrollFrame.onMouseWheel
+    onEnter = ScrollFrame.onEnter
+    onLeave = ScrollFrame.onLeave
+
+    def set_items(self, items):
+        """Replaces the rows of the list, the scroll position is kept"""
+        for index in list(self._shown):
+            self._release(index)
+        self.items = list(items)
+        self._update_scrollregion()
+        self.update_rows()
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+
+    def onScroll(self, first, last):
+        self.vsb.set(first, last)
+        self.update_rows()
+
+    def onCanvasConfigure(self, event):
+        """Rows are stretched to the width of the canvas"""
+        for widget, window in [*self._shown.values(), *self._pool]:
+            self.canvas.itemconfigure(window, width=event.width)
+        self._update_scrollregion()
+        self.update_rows()
+
+    def update_rows(self):
+        if not self.items:
+            return
+
+        if self.row_height is None:
+            self._measure()
+
+        top = self.canvas.canvasy(0)
+        first = max(0, int(top // self.row_height) - self.margin)
+        bottom = top + self.canvas.winfo_height()
+        last = min(len(self.items), int(bottom // self.row_height) + 1 + self.margin)
+
+        for index in list(self._shown):
+            if not first <= index < last:
+                self._release(index)
+        for index in range(first, last):
+            if index not in self._shown:
+                self._acquire(index)
+
+    def _measure(self):
+        # the row isn't laid out yet, but the requested size of each of its widgets is already known
+        widget, window = self._pool[-1] if self._pool else self._create()
+        heights = [child.winfo_reqheight() for child in widget.winfo_children()]
+        self.row_height = max(heights, default=widget.winfo_reqheight()) + self.row_padding
+        self._update_scrollregion()
+
+    def _create(self):
+        widget = self.create_row(self.canvas)
+        window = self.canvas.create_window(
+            0, 0, window=widget, anchor="nw", width=self.canvas.winfo_width(), state="hidden"
+        )
+        self._pool.append((widget, window))
+        return widget, window
+
+    def _acquire(self, index):
+        if not self._pool:
+            self._create()
+        widget, window = self._shown[index] = self._pool.pop()
+        self.bind_row(widget, self.items[index])
+        self.canvas.coords(window, 0, index * self.row_height)
+        self.canvas.itemconfigure(window, state="normal")
+
+    def _release(self, index):
+        widget, window = self._shown.pop(index)
+        self.canvas.itemconfigure(window, state="hidden")
+        if self.unbind_row is not None:
+            self.unbind_row(widget, self.items[index])
+        self._pool.append((widget, window))
+
+    def _update_scrollregion(self):
+        # the size of the list is known without laying out its rows, unlike bbox("all")
+        height = len(self.items) * (self.row_height or 0)
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), height))
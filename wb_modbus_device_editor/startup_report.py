@@ -0,0 +1,138 @@
+import sys
+import time
+
+FLAG = "--startup-report"
+TOP_MODULES = 15  # сколько самых долгих импортов показывать в отчёте
+
+
+class _TimingLoader:
+    """Loader of a module which measures how long the module is executed"""
+
+    def __init__(self, loader, report):
+        self._loader = loader
+        self._report = report
+
+    def __getattr__(self, name):
+        # resource readers, get_data and the rest are the ones of the real loader
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._report.import_started()
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._report.import_finished(module.__name__, time.perf_counter() - start)
+
+
+class _TimingFinder:
+    """Finds modules with the other finders of sys.meta_path and wraps their loaders"""
+
+    def __init__(self, report):
+        self._report = report
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimingLoader(spec.loader, self._report)
+        return spec
+
+
+class StartupReport:
+    """
+    Времена запуска программы: стоимость импорта каждого модуля, время до первой отрисовки окна
+    и до момента, когда окно начинает отвечать пользователю. Отсчёт идёт от загрузки пакета.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks = []  # (событие, время от начала)
+        self.imports = {}  # module name -> (own time, time with nested imports)
+        self._nested = [0.0]  # time of nested imports of each module being imported
+        self._finder = None
+
+    def install(self):
+        if self._finder is None:
+            self._finder = _TimingFinder(self)
+            sys.meta_path.insert(0, self._finder)
+
+    def uninstall(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+        self._finder = None
+
+    def import_started(self):
+        self._nested.append(0.0)
+
+    def import_finished(self, name, elapsed):
+        nested = self._nested.pop()
+        self._nested[-1] += elapsed
+        self.imports[name] = (elapsed - nested, elapsed)
+
+    def mark(self, event):
+        self.marks.append((event, time.perf_counter() - self.started))
+
+    def watch(self, win):
+        """Отмечает первую отрисовку окна и первый свободный цикл обработки событий после неё"""
+        self.mark("Окно создано")
+
+        def on_map(event):
+            if event.widget is win and not painted:
+                painted.append(True)
+                # перерисовка уже запланирована окном, этот обработчик выполнится после неё
+                win.after_idle(on_paint)
+
+        def on_paint():
+            self.mark("Первая отрисовка")
+            win.after(0, lambda: win.after_idle(on_idle))
+
+        def on_idle():
+            self.mark("Готово к работе")
+            self.uninstall()  # дальнейшие импорты относятся к работе программы, а не к запуску
+            self.print()
+
+        painted = []
+        win.bind("<Map>", on_map, add="+")
+
+    def format(self):
+        lines = ["Отчёт о запуске (мс от загрузки пакета):"]
+        for event, elapsed in self.marks:
+            lines.append(f"  {event}: {elapsed * 1000:.0f}")
+
+        total = sum(own for own, _ in self.imports.values())
+        lines.append(f"Импорт модулей: {len(self.imports)}, всего {total * 1000:.0f} мс, самые долгие:")
+        lines.append(f"  {'собственное':>12} {'с вложенными':>13}  модуль")
+        top = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)[:TOP_MODULES]
+        for name, (own, elapsed) in top:
+            lines.append(f"  {own * 1000:12.1f} {elapsed * 1000:13.1f}  {name}")
+        return "\n".join(lines)
+
+    def print(self):
+        print(self.format(), flush=True)
+
+
+_report = None
+
+
+def start():
+    """Starts measuring imports, called by the package before its modules are loaded"""
+    global _report
+    if _report is None:
+        _report = StartupReport()
+        _report.install()
+    return _report
+
+
+def get_report():
+    return _report
@@ -1,25 +1,201 @@
+import ast
+import hashlib
+import json
 import os
 import pathlib
 import platform
 import re
 import tarfile
+import time
 
 import appdirs
-import commentjson
-import jinja2
-import requests
-import semantic_version
+
+from . import json_loader
+from .modbus_formats import FLOAT_FORMATS
 
 
 class TemplateException(Exception):
     pass
 
 
+class Condition:
+    """Condition of a group or a parameter, compiled once to a code object"""
+
+    _ALLOWED_NODES = (
+        ast.Expression,
+        ast.BoolOp,
+        ast.And,
+        ast.Or,
+        ast.UnaryOp,
+        ast.Not,
+        ast.USub,
+        ast.UAdd,
+        ast.Compare,
+        ast.Eq,
+        ast.NotEq,
+        ast.Lt,
+        ast.LtE,
+        ast.Gt,
+        ast.GtE,
+        ast.BinOp,
+        ast.Add,
+        ast.Sub,
+        ast.Mult,
+        ast.Div,
+        ast.Mod,
+        ast.Name,
+        ast.Load,
+        ast.Constant,
+        ast.Call,
+    )
+
+    def __init__(self, source):
+        self.source = source
+        self.names = set()  # parameters the condition depends on, arguments of isDefined included
+
+        # синтаксис выражений wb-mqtt-serial переводится в синтаксис python
+        expression = source.replace("||", " or ").replace("&&", " and ")
+        expression = re.sub(r"!(?!=)", " not ", expression)
+        tree = ast.parse(expression.strip(), mode="eval")
+
+        calls = []
+        for node in ast.walk(tree):
+            if not isinstance(node, self._ALLOWED_NODES):
+                raise ValueError(f"{type(node).__name__} is not allowed in condition")
+            if isinstance(node, ast.Constant) and type(node.value) not in (int, float):
+                raise ValueError(f"Constant {node.value!r} is not allowed in condition")
+            if isinstance(node, ast.Name) and node.id.startswith("_"):
+                raise ValueError(f"Name {node.id} is not allowed in condition")
+            if isinstance(node, ast.Call):
+                self._check_call(node)
+                calls.append(node)
+            elif isinstance(node, ast.Name) and node.id != "isDefined":
+                self.names.add(node.id)
+
+        # isDefined(name) проверяет наличие значения, а не само значение
+        for node in calls:
+            node.func.id = "_is_defined"
+            node.args[0] = ast.copy_location(ast.Constant(node.args[0].id), node.args[0])
+
+        self._code = compile(tree, source, "eval")
+
+    def _check_call(self, node):
+        if not (
+            isinstance(node.func, ast.Name)
+            and node.func.id == "isDefined"
+            and len(node.args) == 1
+            and isinstance(node.args[0], ast.Name)
+            and not node.keywords
+        ):
+            raise ValueError("Only isDefined(name) calls are allowed in condition")
+
+    def evaluate(self, values):
+        return eval(self._code, {"__builtins__": {}, "_is_defined": values.__contains__}, values)
+
+
+def get_file_hash(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+class TemplateCache:
+    """
+    Parsed templates stored as plain JSON with groups and parameters already converted to dicts,
+    so a template file is read and converted only once.
+    An entry is valid while the template has the same path, size and mtime or at least the same content.
+    """
+
+    max_size = 64 * 1024 * 1024  # bytes, least recently used entries are removed above it
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+
+    def _entry_path(self, template_path):
+        name = hashlib.sha256(os.path.abspath(template_path).encode("utf-8")).hexdigest()
+        return os.path.join(self._cache_dir, name + ".json")
+
+    def get(self, template_path):
+        entry_path = self._entry_path(template_path)
+        try:
+            stat = os.stat(template_path)
+            with open(entry_path, encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+
+            if entry["path"] != os.path.abspath(template_path) or entry["size"] != stat.st_size:
+                return None
+            # время изменения могло поменяться без изменения содержимого, например при копировании
+            if entry["mtime"] != stat.st_mtime_ns:
+                if entry["hash"] != get_file_hash(template_path):
+                    return None
+                entry["mtime"] = stat.st_mtime_ns
+                self._write(entry_path, entry)
+
+            os.utime(entry_path)  # mtime of the entry is the time it was used last
+            return entry["properties"]
+        except (OSError, ValueError, KeyError):
+            return None  # нет записи или она повреждена — шаблон просто читается заново
+
+    def put(self, template_path, properties):
+        try:
+            stat = os.stat(template_path)
+            entry = {
+                "path": os.path.abspath(template_path),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "hash": get_file_hash(template_path),
+                "properties": properties,
+            }
+            os.makedirs(self._cache_dir, exist_ok=True)
+            self._write(self._entry_path(template_path), entry)
+            self._evict()
+        except (OSError, TypeError, ValueError):
+            pass  # кэш только ускоряет открытие, без него всё работает
+
+    def _write(self, entry_path, entry):
+        # запись через временный файл, чтобы при сбое не осталось половины записи
+        tmp_path = entry_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as entry_file:
+            json.dump(entry, entry_file, ensure_ascii=False)
+        os.replace(tmp_path, entry_path)
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self._cache_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self._cache_dir):
+            return
+        for entry in os.scandir(self._cache_dir):
+            if entry.is_file():
+                os.remove(entry.path)
+
+
 class Template:
-    def __init__(self, template_path, full_read: bool):
+    def __init__(self, template_path, full_read: bool, cache: TemplateCache = None):
         self._template_path = template_path
+        self._conditions = {}  # condition source -> Condition or error raised by its compilation
+        self._parameters_by_group = {}  # group id (None for parameters without group) -> {id: parameter}
+        self._child_groups = {}  # group id (None for tabs) -> ids of child groups
+        self._root_groups = {}  # group id -> id of the tab the group is on
+        self._value_types = {}  # parameter id -> enum, double or int
         if full_read:
-            self._properties = self._get_template_full_info(self._template_path)
+            self._properties = cache.get(template_path) if cache is not None else None
+            if self._properties is None:
+                self._properties = self._get_template_full_info(self._template_path)
+                if cache is not None:
+                    cache.put(template_path, self._properties)
+            self._build_index()
+            self._compile_conditions()
         else:
             self._properties = self._get_template_basic_info(self._template_path)
 
@@ -29,13 +205,14 @@ class Template:
 
     def _get_template_basic_info(self, template_path):
         with open(template_path, encoding="utf-8") as json_template:
-            dict_info = commentjson.load(json_template)
+            dict_info = json_loader.load(json_template)
             basic_info = {
                 "title": dict_info.get("title", None),
                 "device_type": dict_info.get("device_type", None),
-                "group": dict_info.get("device_type", None),
+                "group": dict_info.get("group", None),
                 "deprecated": dict_info.get("deprecated", None),
                 "translates": dict_info.get("translates", None),
+                "translations": (dict_info.get("device") or {}).get("translations"),
             }
             return basic_info
 
@@ -56,7 +233,7 @@ class Template:
 
     def _get_template_full_info(self, template_path):
         with open(template_path, encoding="utf-8") as json_template:
-            dict_info = commentjson.load(json_template)
+            dict_info = json_loader.load(json_template)
             groups = dict_info["device"].get("groups", {})  # groups and parameters may have dict type
             parameters = dict_info["device"].get("parameters", {})
             full_info = {
@@ -71,32 +248,89 @@ class Template:
             }
             return full_info
 
-    def get_parameters_by_group_id(self, group_id) -> list:
+    def _build_index(self):
+        # индексы строятся один раз при загрузке, чтобы не перебирать все параметры для каждой группы
+        groups = self._properties["device"]["groups"] or {}
+        for id, group in groups.items():
+            self._child_groups.setdefault(group.get("group") or None, []).append(id)
+
+        for id in groups:
+            root_id = id
+            visited = {root_id}
+            while groups.get(root_id, {}).get("group") and groups[root_id]["group"] not in visited:
+                root_id = groups[root_id]["group"]
+                visited.add(root_id)
+            self._root_groups[id] = root_id
+
+        for id, parameter in (self._properties["device"]["parameters"] or {}).items():
+            self._normalize_parameter(id, parameter)
+            self._parameters_by_group.setdefault(parameter.get("group"), {})[id] = parameter
+
+    def _normalize_parameter(self, id, parameter):
+        # адрес и тип регистра приводятся к одному виду, чтобы не разбирать их при каждом чтении и записи
+        address = parameter.get("address")
+        if isinstance(address, str):
+            parameter["address"] = int(address, 0)
+        parameter["reg_type"] = parameter.get("reg_type") or "holding"
+
+        if "enum" in parameter:
+            self._value_types[id] = "enum"
+        elif "scale" in parameter or parameter.get("format") in FLOAT_FORMATS:
+            self._value_types[id] = "double"
+        else:
+            self._value_types[id] = "int"
+
+    def get_parameters_by_group_id(self, group_id) -> dict:
         if self._properties is None:
             return None
 
-        parameters = self._properties["device"]["parameters"]
-        result = {}
-        if parameters is not None:
-            for id, parameter in parameters.items():
-                if parameter.get("group") == group_id:
-                    result.update({id: parameter})
-        return result
+        return self._parameters_by_group.get(group_id, {})
+
+    def get_child_group_ids(self, group_id) -> list:
+        # group_id=None — группы верхнего уровня, то есть вкладки
+        return self._child_groups.get(group_id, [])
+
+    def get_root_group_id(self, group_id):
+        # группа верхнего уровня — это вкладка, на которой находится параметр
+        return self._root_groups.get(group_id, group_id)
+
+    def get_value_type(self, parameter_id):
+        # от типа значения зависит тип и настройки виджета параметра
+        return self._value_types[parameter_id]
 
     def get_parameter_enum(self, parameter_id) -> dict:
         parameter = self._properties["device"]["parameters"][parameter_id]
         enum = parameter["enum"]
-        enum_titles = parameter["enum_titles"]
-        for i, title in enumerate(enum_titles):
-            enum_titles[i] = self.translate(title)
+        # перевод не меняет шаблон, перечисление запрашивается и для модели, и для виджета
+        enum_titles = [self.translate(title) for title in parameter["enum_titles"]]
 
         return {"enum": enum, "enum_titles": enum_titles}
 
+    def _compile_conditions(self):
+        # каждое условие компилируется один раз при загрузке, а не при каждой проверке
+        device = self._properties["device"]
+        for items in (device["groups"], device["parameters"]):
+            for item in (items or {}).values():
+                if item.get("condition"):
+                    self.get_condition(item["condition"])
+
+    def get_condition(self, condition) -> Condition:
+        compiled = self._conditions.get(condition)
+        if compiled is None:
+            try:
+                compiled = Condition(condition)
+            except (SyntaxError, ValueError) as error:
+                compiled = error
+            self._conditions[condition] = compiled
+
+        if isinstance(compiled, Exception):
+            raise RuntimeError(f"Ошибка в выражении: {condition}\n") from compiled
+        return compiled
+
     def calc_parameter_condition(self, condition, values):
+        compiled = self.get_condition(condition)
         try:
-            condition = condition.replace("||", " or ").replace("&&", " and ")
-            condition = re.sub(r"isDefined\(([A-Za-z1-9_]+)\)", r"('\g<1>' in locals())", condition)
-            return eval(condition, {"__builtins__": None, "locals": locals}, values)
+            return compiled.evaluate(values)
         except Exception as error:
             raise RuntimeError(f"Ошибка в выражении: {condition}\n") from error
 
@@ -113,15 +347,23 @@ class Template:
 class TemplateManager:
     _DEFAULT_TEMPLATES_DIR = appdirs.user_data_dir(appname="wb-modbus-device-editor", appauthor="WirenBoard")
     _SHA_FILENAME = "sha"  # commit sha
+    _CACHE_DIRNAME = ".cache"  # parsed templates
+    _CATALOG_FILENAME = "catalog"  # titles and types of all templates, to choose one without reading them
+    _CATALOG_VERSION = 2  # a catalog of another version is built again
+    _REMOTE_SHA_FILENAME = "remote_sha"  # last known sha of the repo and when it was checked
+    _CHECK_INTERVAL = 6 * 60 * 60  # seconds, the repo isn't asked again more often
     _OWNER = "wirenboard"
     _REPO = "wb-mqtt-serial"
 
     def __init__(self, templates_dir: str = _DEFAULT_TEMPLATES_DIR) -> None:
         self._templates_dir = templates_dir
         self._sha_filepath = os.path.join(self._templates_dir, self._SHA_FILENAME)
-        self._need_update, self._latest_sha = self._check_update_needed(
-            self._sha_filepath, self._templates_dir
-        )
+        self._cache = TemplateCache(os.path.join(self._templates_dir, self._CACHE_DIRNAME))
+        self._catalog_filepath = os.path.join(self._templates_dir, self._CATALOG_FILENAME)
+        self._remote_sha_filepath = os.path.join(self._templates_dir, self._REMOTE_SHA_FILENAME)
+        # обновление проверяется в фоне после запуска (check_update), до этого работаем с тем, что скачано
+        self._need_update = None
+        self._latest_sha = None
         self._templates = {}
 
     @property
@@ -136,8 +378,49 @@ class TemplateManager:
     def update_needed(self):
         return self._need_update
 
-    def _check_update_needed(self, sha_filepath, templates_dir) -> bool:
-        latest_sha = self._get_latest_master_sha(self._OWNER, self._REPO)
+    @property
+    def templates_available(self):
+        return os.path.exists(self._sha_filepath)
+
+    def check_update(self, force=False) -> bool:
+        """
+        Checks if the templates are older than the repo. The repo is asked once in _CHECK_INTERVAL,
+        the last known sha is used in between. Raises if the repo is unreachable and nothing is known.
+        """
+        self._need_update, self._latest_sha = self._check_update_needed(
+            self._sha_filepath, self._templates_dir, force
+        )
+        return self._need_update
+
+    def _get_remote_sha(self, force):
+        cached = None
+        try:
+            with open(self._remote_sha_filepath, encoding="utf-8") as remote_sha_file:
+                cached = json.load(remote_sha_file)
+        except (OSError, ValueError):
+            pass
+
+        if cached is not None and not force and 0 <= time.time() - cached["checked"] < self._CHECK_INTERVAL:
+            return cached["sha"]
+
+        try:
+            latest_sha = self._get_latest_master_sha(self._OWNER, self._REPO)
+        except Exception:
+            # без сети работаем с последним известным состоянием репозитория
+            if cached is not None:
+                return cached["sha"]
+            raise
+
+        try:
+            os.makedirs(self._templates_dir, exist_ok=True)
+            with open(self._remote_sha_filepath, "w", encoding="utf-8") as remote_sha_file:
+                json.dump({"sha": latest_sha, "checked": time.time()}, remote_sha_file)
+        except OSError:
+            pass
+        return latest_sha
+
+    def _check_update_needed(self, sha_filepath, templates_dir, force=False) -> bool:
+        latest_sha = self._get_remote_sha(force)
         current_sha = None
 
         if os.path.exists(sha_filepath):
@@ -156,11 +439,19 @@ class TemplateManager:
                 yield member
 
     def _get_latest_master_sha(self, owner, repo):
+        import requests  # импорт занимает около 0.1 с, сеть нужна только фоновой проверке обновлений
+
         url = f"https://api.github.com/repos/{owner}/{repo}/git/matching-refs/heads/master"
         res = requests.get(url, timeout=1).json()
-        return res[0]["object"]["sha"]
+        try:
+            return res[0]["object"]["sha"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise TemplateException(f"Неожиданный ответ GitHub: {res}") from e
 
     def _download_templates(self, owner, repo, templates_dir):
+        import jinja2
+        import requests
+
         tarball_url = f"https://api.github.com/repos/{owner}/{repo}/tarball/master"
         source_raw = requests.get(tarball_url, timeout=1, stream=True)
         source_tar = tarfile.open(fileobj=source_raw.raw, mode="r|gz")
@@ -183,23 +474,104 @@ class TemplateManager:
                 continue
 
     def update_templates(self):
+        if self._need_update is None:
+            self.check_update(force=True)
+
         if self._need_update:
             self._download_templates(self._OWNER, self._REPO, self._templates_dir)
 
             with open(self._sha_filepath, "w", encoding="utf-8") as sha_file:
                 sha_file.write(self._latest_sha)
 
+            # шаблоны обновились, разобранные ранее версии больше не нужны
+            self._cache.clear()
+
+            catalog = {}
             for template_name in os.listdir(self._templates_dir):
+                template_path = os.path.abspath(os.path.join(self._templates_dir, template_name))
 
-                if template_name == self._SHA_FILENAME:
+                # кроме шаблонов в папке лежат sha, кэш и прочие служебные файлы
+                if not template_name.endswith(".json") or not os.path.isfile(template_path):
                     continue
 
-                template_path = os.path.abspath(os.path.join(self._templates_dir, template_name))
-                template = Template(template_path, full_read=False)
-                if template.properties.get("deprecated", None):
+                entry = self._get_catalog_entry(template_path, os.stat(template_path))
+                if entry["deprecated"]:
                     os.remove(template_path)
                     continue
+                catalog[template_name] = entry
+
+            self._save_catalog(catalog)
+
+    def get_catalog(self) -> dict:
+        """
+        Returns {file name: catalog entry} of all templates in the templates dir.
+        The catalog is kept next to the sha file, only new and changed templates are read again.
+        """
+        if not os.path.isdir(self._templates_dir):
+            return {}
+
+        saved = self._load_catalog()
+        catalog = {}
+        changed = False
+        for item in os.scandir(self._templates_dir):
+            if not item.name.endswith(".json") or not item.is_file():
+                continue
+
+            stat = item.stat()
+            entry = saved.get(item.name)
+            if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns:
+                try:
+                    entry = self._get_catalog_entry(item.path, stat)
+                except (OSError, ValueError, AttributeError):
+                    continue  # не шаблон
+                changed = True
+            catalog[item.name] = entry
+
+        if changed or catalog.keys() != saved.keys():
+            self._save_catalog(catalog)
+        return catalog
+
+    def _get_catalog_entry(self, template_path, stat):
+        properties = Template(template_path, full_read=False).properties
+        title = properties["title"]
+        titles = {}
+        for language, translations in (properties["translations"] or {}).items():
+            if title in translations:
+                titles[language] = translations[title]
+
+        return {
+            "title": title,
+            "titles": titles,
+            "device_type": properties["device_type"],
+            "group": properties["group"],
+            "deprecated": bool(properties["deprecated"]),
+            "hash": get_file_hash(template_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+        }
+
+    def _load_catalog(self):
+        try:
+            with open(self._catalog_filepath, encoding="utf-8") as catalog_file:
+                saved = json.load(catalog_file)
+        except (OSError, ValueError):
+            return {}
+
+        # в каталоге первой версии не было номера версии, а в поле group был тип устройства
+        if not isinstance(saved, dict) or saved.get("version") != self._CATALOG_VERSION:
+            return {}
+        return saved.get("templates") or {}
+
+    def _save_catalog(self, catalog):
+        try:
+            tmp_path = self._catalog_filepath + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as catalog_file:
+                saved = {"version": self._CATALOG_VERSION, "templates": catalog}
+                json.dump(saved, catalog_file, ensure_ascii=False)
+            os.replace(tmp_path, self._catalog_filepath)
+        except OSError:
+            pass  # каталог будет собран заново при следующем открытии
 
     def open_template(self, template_path):
-        template = Template(template_path, full_read=True)
+        template = Template(template_path, full_read=True, cache=self._cache)
         return template
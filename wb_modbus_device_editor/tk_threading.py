@@ -1,8 +1,106 @@
+import concurrent.futures
 import queue
+import sys
 import threading
 
+MAX_WORKERS = 8  # общий пул потоков для всех фоновых задач
+MIN_POLLING = 10  # мс, так часто проверяются результаты сразу после запуска задачи или прихода данных
+MAX_POLLING = 100  # мс, до этого значения интервал растёт, пока задачи работают без результатов
+
+CancelledError = concurrent.futures.CancelledError
+
+_executor = None
+_executor_lock = threading.Lock()
+_dispatchers = {}  # window -> _Dispatcher
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix="task")
+        return _executor
+
+
+def shutdown():
+    """Drops tasks which haven't started yet, running ones are finished by the interpreter on exit"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+class _Dispatcher:
+    """
+    Runs callbacks of tasks in the Tk thread in the order the workers sent them.
+    Tk can't be called from the workers, so the queue is checked with after() only while tasks are running:
+    often right after a result, less often while the tasks work silently.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.calls = queue.SimpleQueue()  # (func, args) from the workers
+        self.running = 0  # tasks which callbacks aren't delivered yet, changed only in the Tk thread
+        self.interval = MIN_POLLING
+        self.job = None
+
+    def call(self, func, *args):
+        # the only method called from the workers
+        self.calls.put((func, args))
+
+    def task_started(self):
+        self.running += 1
+        self.interval = MIN_POLLING
+        if self.job is None:
+            self.job = self.window.after(self.interval, self.poll)
+
+    def task_finished(self):
+        self.running -= 1
+
+    def poll(self):
+        self.job = None
+        delivered = self.run_calls()
+        if not self.running:
+            return
+
+        self.interval = MIN_POLLING if delivered else min(self.interval * 2, MAX_POLLING)
+        # a callback may have started a new task, which has already scheduled the next check
+        if self.job is None:
+            self.job = self.window.after(self.interval, self.poll)
+
+    def run_calls(self):
+        delivered = False
+        while True:
+            try:
+                func, args = self.calls.get_nowait()
+            except queue.Empty:
+                return delivered
+
+            delivered = True
+            try:
+                func(*args)
+            except Exception:
+                # как для обработчиков событий Tk: ошибка выводится, остальные вызовы выполняются
+                self.window.report_callback_exception(*sys.exc_info())
+
+
+def _get_dispatcher(window):
+    dispatcher = _dispatchers.get(window)
+    if dispatcher is None:
+        dispatcher = _dispatchers[window] = _Dispatcher(window)
+    return dispatcher
+
 
 class TaskInThread:
+    """
+    Runs computation in the shared pool, then callback(result) or errback(error) in the Tk thread.
+    If progress is given, computation gets a progress keyword argument: a function which may be called
+    from the worker, its arguments are passed to progress in the Tk thread before the result.
+    cancel() drops a task which hasn't started yet, its errback gets CancelledError; a running computation
+    is stopped by its own means: cancel() sets cancel_token, which the computation checks between requests.
+    """
+
     def __init__(
         self,
         window,
@@ -11,42 +109,43 @@ class TaskInThread:
         kwargs=None,
         callback=None,
         errback=None,
-        polling=500,
+        progress=None,
+        cancel_token=None,
     ) -> None:
         if kwargs is None:
             kwargs = {}
 
-        future_result = queue.Queue()
+        self.cancel_token = cancel_token
+        self._dispatcher = _get_dispatcher(window)
+        self._callback = callback
+        self._errback = errback
 
-        worker = threading.Thread(
-            target=self._compute_result, args=(computation, args, kwargs, future_result)
-        )
-        worker.daemon = True
-        worker.start()
+        if progress is not None:
+            kwargs = dict(kwargs, progress=lambda *values: self._dispatcher.call(progress, *values))
 
-        if callback is not None or errback is not None:
-            self._after_completion(window, future_result, callback, errback, polling)
+        self._dispatcher.task_started()
+        self.future = get_executor().submit(computation, *args, **kwargs)
+        self.future.add_done_callback(self._done)
 
-    def _compute_result(self, computation, args, kwargs, future_result):
-        try:
-            _result = computation(*args, **kwargs)
-        except Exception as e:  # disable=broad-except
-            _result = e
+    def cancel(self):
+        """Returns True if the task is dropped before it started, otherwise it is stopped by cancel_token"""
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+        return self.future.cancel()
 
-        future_result.put(_result)
+    def _done(self, future):
+        # called in the worker, or in the Tk thread by cancel() and submit() of an already finished task
+        self._dispatcher.call(self._deliver, future)
 
-    def _after_completion(self, window, future_result, callback, errback, polling):
-        def check():
-            result = None
-            try:
-                result = future_result.get(block=False)
-                if isinstance(result, Exception):
-                    if errback is not None:
-                        errback(result)
-                else:
-                    if callback is not None:
-                        callback(result)
-            except queue.Empty:
-                window.after(polling, check)
+    def _deliver(self, future):
+        self._dispatcher.task_finished()
+        if future.cancelled():  # dropped by cancel() or shutdown() before it started
+            error = CancelledError()
+        else:
+            error = future.exception()
 
-        window.after(0, check)
+        if error is not None:
+            if self._errback is not None:
+                self._errback(error)
+        elif self._callback is not None:
+            self._callback(future.result())
@@ -4,13 +4,12 @@ import tkinter.scrolledtext as scrolltext
 from datetime import datetime
 from tkinter import filedialog, ttk
 
-import serial.tools.list_ports
-
-from . import scroll_frame
+from . import scroll_frame, value_model
 
 
 class UiManager:
     widgets = {}
+    model = None  # значения параметров шаблона, обновляются виджетами
     win = None
     log = None
     notebook = None
@@ -19,14 +18,33 @@ class UiManager:
     btn_read_params = None
     btn_write_params = None
     btn_open_template = None
+    btn_batch = None
+    btn_stop = None
+    btn_batch_read = None
+    btn_batch_write = None
+    btn_stats = None
+    btn_stats_refresh = None
+    btn_stats_json = None
+    btn_stats_prometheus = None
+    btn_stats_reset = None
+    btn_templates_open = None
+    btn_templates_browse = None
+    chk_table_view = None
+    table_view = None  # параметры шаблона показываются таблицами групп вместо отдельных виджетов
 
     def __init__(self):
+        self.model = value_model.ValueModel()
+        # id параметра шаблона -> (enum, value_by_title, index_by_value) или None для чисел
+        self.template_params = {}
+        self.virtual_tabs = {}  # id параметра или группы -> вкладка-список, в которой находится его строка
+        self.table_rows = {}  # id параметра -> таблица группы, в которой он показан в табличном режиме
         self.win = tkinter.Tk()
         self.win.title("Python Modbus Device Editor")
         self.win.geometry("1490x750")
 
         style = ttk.Style(self.win)
         style.theme_use("clam")
+        style.configure("Group.TLabel", font="TkHeadingFont")  # заголовки групп во вкладках-списках
         style.theme_settings(
             "clam",
             {
@@ -99,6 +117,48 @@ class UiManager:
             anchor=tkinter.SW,
         )
 
+        self.btn_batch = self.create_button(
+            parent=mb_actions,
+            id="nodel_btn_batch",
+            title="Пакетный режим",
+            side=tkinter.LEFT,
+            anchor=tkinter.SW,
+        )
+
+        self.btn_stop = self.create_button(
+            parent=mb_actions,
+            id="nodel_btn_stop",
+            title="Остановить",
+            side=tkinter.LEFT,
+            anchor=tkinter.SW,
+        )
+
+        self.btn_stats = self.create_button(
+            parent=mb_actions,
+            id="nodel_btn_stats",
+            title="Статистика",
+            side=tkinter.LEFT,
+            anchor=tkinter.SW,
+        )
+
+        self.table_view = tkinter.BooleanVar(self.win, value=False)
+        self.chk_table_view = self.create_checkbutton(
+            parent=mb_actions,
+            id="nodel_chk_table_view",
+            title="Таблица",
+            variable=self.table_view,
+            side=tkinter.LEFT,
+            anchor=tkinter.SW,
+        )
+
+        self.progress = self.create_progressbar(
+            parent=mb_actions,
+            id="nodel_progress",
+            length=120,
+            side=tkinter.LEFT,
+            anchor=tkinter.SW,
+        )
+
         mb_settings = self.create_group(
             parent=top_frame,
             id="nodel_mb_settings",
@@ -312,6 +372,151 @@ class UiManager:
         self.widgets[id] = viewport
         return viewport
 
+    def create_virtual_tab(self, id, title, selected_func=None):
+        # вкладка с большим числом параметров — список строк, виджеты есть только у строк, видимых при прокрутке
+        tab = ttk.Frame(self.notebook)
+        self.notebook.add(tab, text=title)
+        tab.type = "nb_tab"
+        self.widgets[id + "nb_tab"] = tab
+
+        rows = scroll_frame.VirtualScrollFrame(
+            tab,
+            create_row=lambda parent: self._create_virtual_row(parent, selected_func),
+            bind_row=self._bind_virtual_row,
+            unbind_row=self._unbind_virtual_row,
+        )
+        rows.pack(side=tkinter.LEFT, fill=tkinter.BOTH, expand=True)
+        rows.pack_info = self.get_pack_info(rows)
+        rows.type = "virtual_tab"
+        rows.id = id
+        rows.rows = []  # группы и параметры вкладки в порядке шаблона, в том числе скрытые
+        rows.refresh_job = None
+        self.widgets[id] = rows
+        return rows
+
+    def add_virtual_group(self, tab, id, title):
+        self._add_virtual_row(tab, {"kind": "group", "id": id, "group_id": id, "title": title})
+
+    def add_virtual_combobox(self, tab, id, title, group_id):
+        # перечисление уже есть у параметра в template_params
+        self._add_virtual_row(tab, {"kind": "combobox", "id": id, "group_id": group_id, "title": title})
+
+    def add_virtual_spinbox(self, tab, id, title, min_, max_, value_type, default, description, group_id):
+        if min_ == None:
+            min_ = 0.0
+        if max_ == None:
+            max_ = 100.0
+        if default == None:
+            default = 0
+        row = {
+            "kind": "spinbox",
+            "id": id,
+            "group_id": group_id,
+            "title": title,
+            "min": min_,
+            "max": max_,
+            "format": self.get_combobox_format(value_type),
+            "description": None,
+        }
+        if description != None:
+            row["description"] = "min:{} max:{} default: {}".format(min_, max_, default)
+        self._add_virtual_row(tab, row)
+
+    def _add_virtual_row(self, tab, row):
+        tab.rows.append(row)
+        self.virtual_tabs[row["id"]] = tab
+        self._refresh_virtual_tab(tab)
+
+    def _refresh_virtual_tab(self, tab):
+        # несколько изменений видимости подряд (например, после чтения) пересчитывают список один раз
+        if tab.refresh_job is None:
+            tab.refresh_job = self.win.after_idle(self._show_virtual_rows, tab)
+
+    def _show_virtual_rows(self, tab):
+        tab.refresh_job = None
+        hidden = self.model.hidden
+        tab.set_items([row for row in tab.rows if row["id"] not in hidden and row["group_id"] not in hidden])
+
+    def _create_virtual_row(self, parent, selected_func):
+        # одна строка по очереди показывает разные параметры, поэтому в ней есть виджеты для всех типов
+        row = ttk.Frame(parent)
+        row.item = None
+        row.title = ttk.Label(row, width=50)
+        row.title.pack(padx=5, pady=2, side=tkinter.LEFT)
+
+        row.combobox = ttk.Combobox(row, state="readonly", width=50)
+        row.combobox.type = "combobox"
+        if selected_func:
+            row.combobox.bind("<<ComboboxSelected>>", selected_func)
+
+        row.spinbox = ttk.Spinbox(row, width=5)
+        row.spinbox.type = "spinbox"
+        row.description = ttk.Label(row)
+
+        for widget in (row.combobox, row.spinbox):
+            widget.visible = True
+            widget.variable = tkinter.StringVar(row)
+            widget.configure(textvariable=widget.variable)
+            widget.variable.trace_add(
+                "write", lambda *args, widget=widget: self._virtual_row_changed(row, widget)
+            )
+        return row
+
+    def _virtual_row_changed(self, row, widget):
+        # пока строка показывает параметр, его значение попадает в модель, как у обычного виджета
+        if row.item is None or row.item["kind"] != widget.type:
+            return
+        if widget.type == "combobox":
+            self.model.set_value(row.item["id"], widget.value_by_title.get(widget.variable.get()))
+        else:
+            self.model.set_value(row.item["id"], self.parse_number(widget.variable.get()))
+
+    def _bind_virtual_row(self, row, item):
+        row.item = None  # пока строка настраивается, её переменные не меняют модель
+        for widget in (row.combobox, row.spinbox, row.description):
+            widget.pack_forget()
+
+        if item["kind"] == "group":
+            row.title.configure(text=item["title"], style="Group.TLabel")
+            row.item = item
+            return
+
+        id = item["id"]
+        value = self.model.values.get(id)
+        row.title.configure(text=item["title"], style="TLabel")
+
+        if item["kind"] == "combobox":
+            widget = row.combobox
+            widget.dic, widget.value_by_title, widget.index_by_value = self.template_params[id]
+            widget.configure(values=widget.dic["enum_titles"])
+            if value in widget.index_by_value:
+                widget.current(widget.index_by_value[value])
+            else:
+                widget.set("")
+            state = "readonly"
+        else:
+            widget = row.spinbox
+            widget.configure(from_=item["min"], to=item["max"], format=item["format"])
+            widget.set("" if value is None else value)
+            state = "normal"
+
+        widget.id = id
+        widget.configure(state="disabled" if id in self.model.disabled else state)
+        widget.pack(padx=5, pady=2, side=tkinter.LEFT)
+        if item.get("description") != None:
+            row.description.configure(text=item["description"])
+            row.description.pack(padx=5, pady=2, side=tkinter.LEFT)
+
+        # пока строка видна, с параметром работают так же, как с обычным виджетом: set_value, widget_disable...
+        self.widgets[id] = widget
+        row.item = item
+
+    def _unbind_virtual_row(self, row, item):
+        row.item = None
+        widget = self.widgets.get(item["id"])
+        if widget is row.combobox or widget is row.spinbox:
+            del self.widgets[item["id"]]
+
     def create_scrolled_text(self, parent, id, width, **opts):
         scrolled_text = scrolltext.ScrolledText(parent, width=width, wrap="word")
         self._widget_commit(
@@ -356,11 +561,25 @@ class UiManager:
         )
         return button
 
+    def create_checkbutton(self, parent, id, title, variable, command=None, **opts):
+        checkbutton = ttk.Checkbutton(parent, text=title, variable=variable, command=command)
+        self._widget_commit(
+            widget=checkbutton,
+            widget_id=id,
+            widget_type="checkbutton",
+            widget_opts={"padx": 5, "pady": 5, **opts},
+            parent_id=parent.id,
+        )
+        return checkbutton
+
     def create_combobox(self, parent, id, title, dic, default, width, selected_func=None, **opts):
         enums = dic["enum_titles"]
         group = self.create_group(parent, id + "_title", title, relief=tkinter.FLAT, **opts)
-        combobox = ttk.Combobox(group, values=enums, state="readonly", width=width)
+        variable = tkinter.StringVar(group)
+        combobox = ttk.Combobox(group, values=enums, state="readonly", width=width, textvariable=variable)
         combobox.dic = dic
+        combobox.value_by_title, combobox.index_by_value = self.get_enum_maps(dic)
+        self._track_value(combobox, id, variable, combobox.value_by_title.get)
         self._widget_commit(
             widget=combobox,
             widget_id=id,
@@ -372,14 +591,66 @@ class UiManager:
         if selected_func:
             combobox.bind("<<ComboboxSelected>>", selected_func)
 
-        if default in dic["enum"]:
-            index = dic["enum"].index(default)
-            combobox.current(index)
+        if default in combobox.index_by_value:
+            combobox.current(combobox.index_by_value[default])
         elif len(enums) >= 1:
             combobox.current(0)
 
         return combobox
 
+    def get_enum_maps(self, dic):
+        value_by_title = dict(zip(dic["enum_titles"], dic["enum"]))
+        index_by_value = {value: index for index, value in reversed(list(enumerate(dic["enum"])))}
+        return value_by_title, index_by_value
+
+    def declare_param(self, id, dic, default):
+        """
+        Параметр шаблона, виджет которого может быть создан позже (при открытии вкладки).
+        В модель сразу попадает то значение, которое установил бы виджет; dic — перечисление или None для чисел
+        """
+        if dic is None:
+            self.template_params[id] = None
+            self.model.set_value(id, self.parse_number(str(0 if default == None else default)))
+            return
+
+        value_by_title, index_by_value = self.get_enum_maps(dic)
+        self.template_params[id] = (dic, value_by_title, index_by_value)
+        if default in index_by_value:
+            self.model.set_value(id, value_by_title[dic["enum_titles"][index_by_value[default]]])
+        elif len(dic["enum_titles"]) >= 1:
+            self.model.set_value(id, value_by_title[dic["enum_titles"][0]])
+
+    def restore_widget(self, widget_id, value=None):
+        # виджет создан после того, как параметр попал в модель: показывает её значение и состояние
+        if value is not None:
+            self.set_value(widget_id, value)
+        if widget_id in self.model.disabled:
+            self.widget_disable(widget_id)
+        if widget_id in self.model.hidden:
+            self.widget_hide(widget_id)
+
+    def _track_value(self, widget, id, variable, convert):
+        # значения параметров шаблона попадают в модель при любом изменении виджета: вводом, стрелками, чтением
+        widget.variable = variable  # Tk variable lives while python object does
+        if id.startswith("nodel_"):
+            return
+        variable.trace_add("write", lambda *args: self.model.set_value(id, convert(variable.get())))
+
+    def get_enum_index(self, index_by_value, value):
+        # значение, которого нет в шаблоне (например, прочитанное из устройства) — ValueError, как у list.index
+        try:
+            return index_by_value[value]
+        except KeyError:
+            raise ValueError(f"{value} is not in enum") from None
+
+    def parse_number(self, text):
+        for type_ in (int, float):
+            try:
+                return type_(text)
+            except ValueError:
+                pass
+        return None
+
     def get_combobox_format(self, value_type):
         if value_type == "double":
             fmt = "%.2f"
@@ -412,7 +683,9 @@ class UiManager:
         fmt = self.get_combobox_format(value_type)
 
         group = self.create_group(parent, id + "_title", title, relief=tkinter.FLAT, **opts)
-        spinbox = ttk.Spinbox(group, from_=min_, to=max_, format=fmt, width=width)
+        variable = tkinter.StringVar(group)
+        spinbox = ttk.Spinbox(group, from_=min_, to=max_, format=fmt, width=width, textvariable=variable)
+        self._track_value(spinbox, id, variable, self.parse_number)
 
         if default == None:
             default = 0
@@ -434,7 +707,7 @@ class UiManager:
             )
         return spinbox
 
-    def create_text_input(self, parent: tkinter.Widget, id, title, validation_func, **opts):
+    def create_text_input(self, parent: tkinter.Widget, id, title, validation_func, width=23, **opts):
         group = self.create_group(parent, id + "_title", title, relief=tkinter.FLAT, **opts)
 
         value = tkinter.StringVar()
@@ -442,7 +715,7 @@ class UiManager:
         entry = ttk.Entry(
             group,
             textvariable=value,
-            width=23,
+            width=width,
             validate="focusout",
             validatecommand=(validatecommand, "%P"),
             state="normal",
@@ -454,6 +727,412 @@ class UiManager:
             widget_opts={"padx": 5, "pady": 0, "side": tkinter.TOP, "anchor": tkinter.NW},
             parent_id=parent.id,
         )
+        return entry
+
+    def create_progressbar(self, parent, id, length, **opts):
+        group = self.create_group(parent, id + "_title", "", relief=tkinter.FLAT, **opts)
+        progressbar = ttk.Progressbar(group, orient=tkinter.HORIZONTAL, length=length, mode="determinate")
+        self._widget_commit(
+            widget=progressbar,
+            widget_id=id,
+            widget_type="progressbar",
+            widget_opts={"padx": 5, "pady": 0, "side": tkinter.TOP, "anchor": tkinter.NW},
+            parent_id=parent.id,
+        )
+        return progressbar
+
+    def set_progress(self, done, total, text=""):
+        self.progress.configure(maximum=max(total, 1), value=done)
+        self.widgets["nodel_progress_title"].configure(text=text)
+
+    def create_table(self, parent, id, columns, height=10, **opts):
+        # columns — словарь {id колонки: заголовок}
+        table = ttk.Treeview(parent, columns=list(columns), show="headings", height=height)
+        for column, title in columns.items():
+            table.heading(column, text=title)
+            table.column(column, width=max(80, len(title) * 9), stretch=True)
+
+        self._widget_commit(
+            widget=table,
+            widget_id=id,
+            widget_type="table",
+            widget_opts={"padx": 5, "pady": 5, **opts},
+            parent_id=parent.id,
+        )
+        return table
+
+    def create_params_table(self, parent, id, selected_func=None, **opts):
+        # табличный режим: все параметры группы — строки одной таблицы, значение редактируется поверх ячейки
+        table = self.create_table(
+            parent,
+            id,
+            {
+                "id": "Id",
+                "title": "Название",
+                "address": "Адрес",
+                "value": "Значение",
+                "units": "Ед.",
+                "range": "Диапазон",
+            },
+            height=1,
+            **opts,
+        )
+        table.configure(selectmode="browse")
+        table.column("title", width=300)
+        table.column("value", width=250)
+        table.tag_configure("disabled", foreground="gray")
+        table.rows = []  # параметры в порядке шаблона, в том числе скрытые
+        table.limits = {}  # id числового параметра -> (min, max, формат) для поля редактирования
+        table.refresh_job = None
+        table.editor = None
+        table.selected_func = selected_func
+        table.bind("<Double-1>", lambda event: self._edit_table_value(table, table.identify_row(event.y)))
+        table.bind("<Return>", lambda event: self._edit_table_value(table, table.focus()))
+        return table
+
+    def add_table_param(self, table, id, title, address, units, min_=None, max_=None, value_type=None):
+        # min_, max_ и value_type нужны только числовым параметрам, как у create_spinbox
+        range_ = ""
+        if self.template_params[id] is None:
+            if min_ == None:
+                min_ = 0.0
+            if max_ == None:
+                max_ = 100.0
+            range_ = "{}..{}".format(min_, max_)
+        table.insert("", tkinter.END, iid=id, values=(id, title, address, "", units, range_))
+        table.rows.append(id)
+        table.limits[id] = (min_, max_, self.get_combobox_format(value_type))
+        self.table_rows[id] = table
+        self._update_table_value(id)
+        self._refresh_table(table)
+
+    def _get_table_text(self, id):
+        value = self.model.values.get(id)
+        enum = self.template_params[id]
+        if value is None:
+            return ""
+        if enum is not None and value in enum[2]:
+            return enum[0]["enum_titles"][enum[2][value]]
+        return str(value)
+
+    def _update_table_value(self, id):
+        table = self.table_rows[id]
+        table.set(id, "value", self._get_table_text(id))
+        table.item(id, tags=("disabled",) if id in self.model.disabled else ())
+
+    def _refresh_table(self, table):
+        # изменения видимости после чтения или выбора значения применяются к таблице один раз
+        if table.refresh_job is None:
+            table.refresh_job = self.win.after_idle(self._show_table_rows, table)
+
+    def _show_table_rows(self, table):
+        table.refresh_job = None
+        index = 0
+        for id in table.rows:
+            if id in self.model.hidden:
+                table.detach(id)
+            else:
+                table.move(id, "", index)
+                index += 1
+        table.configure(height=max(index, 1))
+
+    def _edit_table_value(self, table, id):
+        if not id or id in self.model.disabled or table.editor is not None:
+            return
+        bbox = table.bbox(id, "value")
+        if not bbox:
+            return  # ячейка не видна
+
+        enum = self.template_params[id]
+        if enum is not None:
+            editor = ttk.Combobox(table, values=enum[0]["enum_titles"], state="readonly")
+            editor.type = "combobox"
+            editor.bind("<<ComboboxSelected>>", lambda event: self._finish_table_edit(table, editor, event))
+        else:
+            min_, max_, fmt = table.limits[id]
+            editor = ttk.Spinbox(table, from_=min_, to=max_, format=fmt)
+            editor.type = "spinbox"
+        editor.id = id
+        editor.set(self._get_table_text(id))
+        editor.bind("<Return>", lambda event: self._finish_table_edit(table, editor, event))
+        editor.bind("<Escape>", lambda event: self._finish_table_edit(table, editor, None))
+        # фокус уходит и в выпадающий список combobox, поэтому он проверяется, когда уже перешёл
+        editor.bind(
+            "<FocusOut>", lambda event: self.win.after_idle(self._table_editor_focus_out, table, event)
+        )
+
+        x, y, width, height = bbox
+        editor.place(x=x, y=y, width=width, height=height)
+        editor.focus_set()
+        table.editor = editor
+
+    def _table_editor_focus_out(self, table, event):
+        focus = str(self.win.tk.call("focus"))
+        if not focus.startswith(str(event.widget)):
+            self._finish_table_edit(table, event.widget, event)
+
+    def _finish_table_edit(self, table, editor, event):
+        # event=None — редактирование отменено
+        if table.editor is not editor:
+            return
+        table.editor = None
+
+        if event is not None:
+            enum = self.template_params[editor.id]
+            if enum is not None:
+                value = enum[1].get(editor.get())
+            else:
+                value = self.parse_number(editor.get())
+            # неверное число не меняет значение, прежнее значение остаётся в таблице
+            if value is not None:
+                self.model.set_value(editor.id, value)
+                self._update_table_value(editor.id)
+                if enum is not None and table.selected_func:
+                    table.selected_func(event)
+
+        editor.destroy()
+        table.focus_set()
+
+    def create_batch_window(self):
+        window = tkinter.Toplevel(self.win)
+        window.title("Пакетная настройка устройств")
+        window.geometry("900x500")
+        window.protocol("WM_DELETE_WINDOW", self.close_batch_window)
+        window.type = "window"
+        window.id = "nodel_batch_window"
+        self.widgets[window.id] = window
+
+        targets = self.create_group(
+            parent=window, id="nodel_batch_targets", title="Устройства", side=tkinter.TOP, fill=tkinter.X
+        )
+
+        self.create_text_input(
+            parent=targets,
+            id="nodel_batch_slave_ids",
+            title="Адреса (например, 1-10, 15)",
+            validation_func=lambda value: True,
+            width=30,
+            side=tkinter.LEFT,
+        )
+
+        self.create_text_input(
+            parent=targets,
+            id="nodel_batch_buses",
+            title="Порты или шлюзы host:port (пусто — текущее подключение)",
+            validation_func=lambda value: True,
+            width=50,
+            side=tkinter.LEFT,
+        )
+
+        self.btn_batch_read = self.create_button(
+            parent=targets,
+            id="nodel_btn_batch_read",
+            title="Прочитать и сравнить",
+            side=tkinter.LEFT,
+            anchor=tkinter.SW,
+        )
+
+        self.btn_batch_write = self.create_button(
+            parent=targets,
+            id="nodel_btn_batch_write",
+            title="Записать",
+            side=tkinter.LEFT,
+            anchor=tkinter.SW,
+        )
+
+        results = self.create_group(
+            parent=window,
+            id="nodel_batch_results",
+            title="Результаты",
+            side=tkinter.TOP,
+            fill=tkinter.BOTH,
+            expand=True,
+        )
+
+        self.create_table(
+            parent=results,
+            id="nodel_batch_table",
+            columns={
+                "bus": "Шина",
+                "slave_id": "Адрес",
+                "result": "Результат",
+                "total": "Параметров",
+                "failed": "Ошибок",
+                "mismatched": "Отличается",
+                "duration": "Время, с",
+            },
+            side=tkinter.TOP,
+            fill=tkinter.BOTH,
+            expand=True,
+        )
+
+        self.create_label(
+            parent=results, id="nodel_batch_summary", title="", side=tkinter.TOP, anchor=tkinter.W
+        )
+        return window
+
+    def close_batch_window(self):
+        window = self.widgets.get("nodel_batch_window")
+        for key in list(self.widgets):
+            if key.startswith("nodel_batch") or key.startswith("nodel_btn_batch_"):
+                del self.widgets[key]
+        window.destroy()
+
+    def show_batch_results(self, rows, summary):
+        table = self.widgets["nodel_batch_table"]
+        table.delete(*table.get_children())
+        for row in rows:
+            table.insert("", tkinter.END, values=row)
+
+        self.widgets["nodel_batch_summary"].configure(text=summary)
+
+    def create_stats_window(self):
+        window = tkinter.Toplevel(self.win)
+        window.title("Статистика обмена")
+        window.geometry("1200x400")
+        window.protocol("WM_DELETE_WINDOW", self.close_stats_window)
+        window.type = "window"
+        window.id = "nodel_stats_window"
+        self.widgets[window.id] = window
+
+        actions = self.create_group(
+            parent=window, id="nodel_stats_actions", title="", side=tkinter.TOP, fill=tkinter.X
+        )
+
+        self.btn_stats_refresh = self.create_button(
+            parent=actions, id="nodel_btn_stats_refresh", title="Обновить", side=tkinter.LEFT
+        )
+
+        self.btn_stats_json = self.create_button(
+            parent=actions, id="nodel_btn_stats_json", title="Сохранить JSON", side=tkinter.LEFT
+        )
+
+        self.btn_stats_prometheus = self.create_button(
+            parent=actions,
+            id="nodel_btn_stats_prometheus",
+            title="Сохранить для Prometheus",
+            side=tkinter.LEFT,
+        )
+
+        self.btn_stats_reset = self.create_button(
+            parent=actions, id="nodel_btn_stats_reset", title="Сбросить", side=tkinter.LEFT
+        )
+
+        self.create_table(
+            parent=window,
+            id="nodel_stats_table",
+            columns={
+                "bus": "Шина",
+                "slave_id": "Адрес",
+                "firmware": "Прошивка",
+                "function": "Запрос",
+                "count": "Всего",
+                "ok": "Успешно",
+                "exceptions": "Исключений",
+                "timeouts": "Таймаутов",
+                "errors": "Ошибок",
+                "repeated": "После ошибки",
+                "avg_ms": "Среднее, мс",
+                "p95_ms": "p95, мс",
+                "sent_bytes": "Отправлено, байт",
+                "received_bytes": "Получено, байт",
+            },
+            side=tkinter.TOP,
+            fill=tkinter.BOTH,
+            expand=True,
+        )
+        return window
+
+    def close_stats_window(self):
+        window = self.widgets.get("nodel_stats_window")
+        for key in list(self.widgets):
+            if key.startswith("nodel_stats") or key.startswith("nodel_btn_stats_"):
+                del self.widgets[key]
+        window.destroy()
+
+    def show_stats(self, rows):
+        table = self.widgets["nodel_stats_table"]
+        table.delete(*table.get_children())
+        for row in rows:
+            table.insert("", tkinter.END, values=row)
+
+    def create_templates_window(self):
+        window = tkinter.Toplevel(self.win)
+        window.title("Выбор шаблона")
+        window.geometry("900x500")
+        window.protocol("WM_DELETE_WINDOW", self.close_templates_window)
+        window.type = "window"
+        window.id = "nodel_templates_window"
+        self.widgets[window.id] = window
+
+        search = self.create_group(
+            parent=window, id="nodel_templates_search", title="", side=tkinter.TOP, fill=tkinter.X
+        )
+
+        entry = self.create_text_input(
+            parent=search,
+            id="nodel_templates_filter",
+            title="Поиск по названию, типу устройства или имени файла",
+            validation_func=lambda value: True,
+            width=50,
+            side=tkinter.LEFT,
+        )
+        entry.focus_set()
+
+        self.btn_templates_open = self.create_button(
+            parent=search,
+            id="nodel_btn_templates_open",
+            title="Открыть",
+            side=tkinter.LEFT,
+            anchor=tkinter.SW,
+        )
+
+        self.btn_templates_browse = self.create_button(
+            parent=search,
+            id="nodel_btn_templates_browse",
+            title="Выбрать файл...",
+            side=tkinter.LEFT,
+            anchor=tkinter.SW,
+        )
+
+        table = self.create_table(
+            parent=window,
+            id="nodel_templates_table",
+            columns={"title": "Название", "device_type": "Тип устройства", "file": "Файл"},
+            height=20,
+            side=tkinter.TOP,
+            fill=tkinter.BOTH,
+            expand=True,
+        )
+        table.column("title", width=450)
+        return window
+
+    def close_templates_window(self):
+        window = self.widgets.get("nodel_templates_window")
+        for key in list(self.widgets):
+            if key.startswith("nodel_templates") or key.startswith("nodel_btn_templates_"):
+                del self.widgets[key]
+        window.destroy()
+
+    def show_templates(self, rows):
+        # rows — (имя файла, название, тип устройства), имя файла служит id строки
+        table = self.widgets["nodel_templates_table"]
+        table.delete(*table.get_children())
+        for file_name, title, device_type in rows:
+            table.insert("", tkinter.END, iid=file_name, values=(title, device_type, file_name))
+
+        children = table.get_children()
+        if children:
+            table.selection_set(children[0])
+
+    def get_selected_template(self):
+        selection = self.widgets["nodel_templates_table"].selection()
+        return selection[0] if selection else None
+
+    def save_file(self, title, extension, file_type):
+        return filedialog.asksaveasfilename(
+            title=title, defaultextension=extension, filetypes=[(file_type, "*" + extension)]
+        )
 
     def is_exists_widget(self, id):
         return self.widgets.get(id) is not None
@@ -463,6 +1142,12 @@ class UiManager:
 
     def set_value(self, widget_id, value, scale=None):
         widget = self.widgets.get(widget_id)
+        if widget is None:
+            self._set_model_value(widget_id, value, scale)
+            if widget_id in self.table_rows:
+                self._update_table_value(widget_id)
+            return
+
         if widget.type == "spinbox":
             if scale != None:
                 value = value * scale
@@ -471,9 +1156,22 @@ class UiManager:
                 widget.set(value)
         else:
             if widget.type == "combobox":
-                dic = widget.dic
-                index = dic["enum"].index(value)
-                widget.current(index)
+                widget.current(self.get_enum_index(widget.index_by_value, value))
+
+    def _set_model_value(self, widget_id, value, scale):
+        # виджет ещё не создан, значение попадает в модель в том же виде, в каком его записал бы виджет
+        if widget_id not in self.template_params:
+            return
+
+        enum = self.template_params[widget_id]
+        if enum is None:
+            if scale != None:
+                value = value * scale
+            self.model.set_value(widget_id, self.parse_number(str(value)))
+        else:
+            dic, value_by_title, index_by_value = enum
+            index = self.get_enum_index(index_by_value, value)
+            self.model.set_value(widget_id, value_by_title[dic["enum_titles"][index]])
 
     def get_value(self, widget_id):
         widget = self.widgets[widget_id]
@@ -482,34 +1180,13 @@ class UiManager:
                 return widget.get()
 
             if widget.type == "combobox":
-                dic = widget.dic
-                value = widget.get()
-                index = dic["enum_titles"].index(value)
-                return dic["enum"][index]
+                return widget.value_by_title[widget.get()]
         else:
             return None
 
     def get_values(self):
-        widgets = self.widgets
-        values = {}
-
-        for key, item in widgets.items():
-            if item.type in ["spinbox", "combobox"] and not item.visible:
-                continue
-
-            if item.type == "spinbox":
-                values.update({key: item.get()})
-
-            if item.type == "combobox":
-                value = item.get()
-                dic = item.dic
-                try:
-                    index = dic["enum_titles"].index(value)
-                    values.update({key: dic["enum"][index]})
-                except ValueError:
-                    pass
-
-        return values
+        # значения видимых параметров для условий, из модели, без опроса виджетов
+        return self.model.visible_values
 
     def get_modbus_params(self):
         mode = self.get_value("nodel_mb_mode")
@@ -534,6 +1211,13 @@ class UiManager:
             return {**common_params, **tcp_params}
         return None
 
+    def get_current_tab_id(self):
+        selected = self.notebook.select()
+        for key, item in self.widgets.items():
+            if item.type == "nb_tab" and str(item) == selected:
+                return key.removesuffix("nb_tab")
+        return None
+
     def get_widget(self, widget_id):
         return self.widgets.get(widget_id)
 
@@ -541,6 +1225,14 @@ class UiManager:
         return self.widgets
 
     def widget_hide(self, widget_id):
+        self.model.set_visible(widget_id, False)
+        if widget_id in self.virtual_tabs:
+            self._refresh_virtual_tab(self.virtual_tabs[widget_id])
+            return
+        if widget_id in self.table_rows:
+            self._refresh_table(self.table_rows[widget_id])
+            return
+
         widget = self.widgets.get(widget_id)
         # if widget.type != "group":
         if widget != None:
@@ -556,7 +1248,18 @@ class UiManager:
                 widget.pack_forget()
 
     def widget_show(self, widget_id):
-        widget = self.widgets[widget_id]
+        self.model.set_visible(widget_id, True)
+        if widget_id in self.virtual_tabs:
+            self._refresh_virtual_tab(self.virtual_tabs[widget_id])
+            return
+        if widget_id in self.table_rows:
+            self._refresh_table(self.table_rows[widget_id])
+            return
+
+        widget = self.widgets.get(widget_id)
+        if widget == None:
+            return  # виджет будет создан уже видимым
+
         widget.pack(widget.pack_info)
         widget.visible = True
 
@@ -572,11 +1275,20 @@ class UiManager:
             widget.pack(widget.pack_info)
 
     def widget_disable(self, widget_id):
-        widget = self.widgets[widget_id]
-        widget.config(state="disable")
+        self.model.set_enabled(widget_id, False)
+        if widget_id in self.table_rows:
+            self._update_table_value(widget_id)
+        widget = self.widgets.get(widget_id)
+        if widget != None:
+            widget.config(state="disable")
 
     def widget_enable(self, widget_id):
-        widget = self.widgets[widget_id]
+        self.model.set_enabled(widget_id, True)
+        if widget_id in self.table_rows:
+            self._update_table_value(widget_id)
+        widget = self.widgets.get(widget_id)
+        if widget == None:
+            return
 
         if widget.type == "combobox":
             widget.config(state="readonly")
@@ -594,12 +1306,25 @@ class UiManager:
         del self.widgets[key]
 
     def delete_widgets(self):
+        for tab in set(self.virtual_tabs.values()):
+            if tab.refresh_job is not None:
+                self.win.after_cancel(tab.refresh_job)
+        self.virtual_tabs.clear()
+        for table in set(self.table_rows.values()):
+            if table.refresh_job is not None:
+                self.win.after_cancel(table.refresh_job)
+        self.table_rows.clear()
+
         widgets = dict(self.widgets)
         for key in widgets:
             if "nodel_" not in key:
                 self.remove_widgets_item(key)
+        self.model.clear()
+        self.template_params.clear()
 
     def get_ports(self):
+        import serial.tools.list_ports
+
         enum = []
         enum_titles = []
         ports = list(serial.tools.list_ports.comports())
@@ -0,0 +1,49 @@
+class ValueModel:
+    """
+    Values of template parameters kept in Python. Widgets update it from traces of their variables,
+    so conditions and writes read values from memory instead of querying every Tk widget.
+    """
+
+    def __init__(self):
+        self.values = {}  # parameter id -> value shown in the widget
+        self.visible_values = {}  # values of parameters shown in the interface, names for conditions
+        self.hidden = set()
+        self.disabled = set()
+
+    def set_value(self, id, value):
+        # None is an empty spinbox or a combobox text which isn't in the enum
+        if value is None:
+            self.values.pop(id, None)
+            self.visible_values.pop(id, None)
+            return
+
+        self.values[id] = value
+        if id not in self.hidden:
+            self.visible_values[id] = value
+
+    def set_visible(self, id, visible):
+        if visible:
+            self.hidden.discard(id)
+            if id in self.values:
+                self.visible_values[id] = self.values[id]
+        else:
+            self.hidden.add(id)
+            self.visible_values.pop(id, None)
+
+    def set_enabled(self, id, enabled):
+        if enabled:
+            self.disabled.discard(id)
+        else:
+            self.disabled.add(id)
+
+    def get(self, id):
+        # a disabled parameter has no value to write, like ui_manager.get_value of a disabled widget
+        if id in self.disabled:
+            return None
+        return self.values.get(id)
+
+    def clear(self):
+        self.values.clear()
+        self.visible_values.clear()
+        self.hidden.clear()
+        self.disabled.clear()